@@ -0,0 +1,289 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Callable, Dict, Any, List
+
+from retry import CANCELLED, InferenceError, RATE_LIMITED
+
+# Global limits shared by every server process that uses the same database file (overridable through .env)
+ADMISSION_ENABLED = os.getenv("SMOLLM3_ADMISSION", "1") != "0"
+ADMISSION_PATH = os.getenv("SMOLLM3_ADMISSION_PATH") or os.path.join(".cache", "admission.sqlite3")
+MAX_CONCURRENCY = int(os.getenv("SMOLLM3_MAX_CONCURRENCY") or 8)
+# Token buckets refill per minute; 0 disables a bucket
+MAX_REQUESTS_PER_MIN = float(os.getenv("SMOLLM3_MAX_REQUESTS_PER_MIN") or 0)
+MAX_TOKENS_PER_MIN = float(os.getenv("SMOLLM3_MAX_TOKENS_PER_MIN") or 0)
+QUEUE_TIMEOUT = float(os.getenv("SMOLLM3_QUEUE_TIMEOUT") or 600)
+# Admitted requests whose process died are reclaimed after this many seconds; live processes
+# renew their requests' leases every third of this, however long retries and streams take
+LEASE_SECONDS = float(os.getenv("SMOLLM3_ADMISSION_LEASE") or 300)
+# Waiters refresh their heartbeat on every poll; silent ones have gone away
+WAITER_STALE_SECONDS = 15.0
+POLL_SECONDS = 0.25
+# Initial guess of how long a request holds its slot, refined as requests finish
+DEFAULT_HOLD_SECONDS = 10.0
+HOLD_EWMA_ALPHA = 0.2
+
+QUEUED = "queued"
+
+
+class AdmissionController:
+    """Cross-process concurrency semaphore, request/token buckets and fair queue in one SQLite file
+
+    Every state change runs in a BEGIN IMMEDIATE transaction, so server
+    processes sharing the file see a consistent view. Waiting requests are
+    ordered round-robin across sessions: a session's second outstanding
+    request ranks behind every other session's first, and ties go to the
+    session served least recently. A background thread renews the leases of
+    the slots this process holds, so only slots of dead processes expire.
+    """
+
+    def __init__(
+        self,
+        path: str = ADMISSION_PATH,
+        max_concurrency: int = MAX_CONCURRENCY,
+        requests_per_min: float = MAX_REQUESTS_PER_MIN,
+        tokens_per_min: float = MAX_TOKENS_PER_MIN,
+        lease: float = LEASE_SECONDS,
+    ):
+        self.path = path
+        self.max_concurrency = max(1, max_concurrency)
+        # Buckets hold up to one minute of budget
+        self.buckets = {name: rate for name, rate in (("requests", requests_per_min), ("tokens", tokens_per_min)) if rate > 0}
+        self.lease = lease
+        self.admitted = 0
+        self.queued = 0
+        self.wait_seconds = 0.0
+        self._lock = threading.Lock()
+        # Session and token reservation of every ticket this process has not released yet
+        self._held: Dict[str, tuple] = {}
+        self._renewer = None
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS tickets (
+                ticket TEXT PRIMARY KEY,
+                session TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                enqueued REAL NOT NULL,
+                heartbeat REAL NOT NULL,
+                admitted REAL
+            )
+        """)
+        self._db.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS served (session TEXT PRIMARY KEY, admitted REAL NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value REAL NOT NULL)")
+
+    def _transaction(self, work: Callable[[float], Any]) -> Any:
+        """Run work(now) inside an immediate (write-locked) transaction"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(time.time())
+                self._db.execute("COMMIT")
+                return result
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _bucket_level(self, name: str, now: float) -> float:
+        """Current level of a bucket after refilling since its last update"""
+        rate = self.buckets[name]
+        row = self._db.execute("SELECT level, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return rate
+        return min(rate, row[0] + (now - row[1]) * rate / 60)
+
+    def _set_bucket(self, name: str, level: float, now: float):
+        self._db.execute("INSERT OR REPLACE INTO buckets (name, level, updated) VALUES (?, ?, ?)", (name, level, now))
+
+    def _hold_seconds(self) -> float:
+        """Moving average of how long admitted requests keep their slot"""
+        row = self._db.execute("SELECT value FROM state WHERE name = 'hold_seconds'").fetchone()
+        return row[0] if row else DEFAULT_HOLD_SECONDS
+
+    def _waiting(self) -> List[str]:
+        """Tickets still queued, in fair round-robin order across sessions"""
+        rows = self._db.execute("SELECT ticket, session FROM tickets WHERE admitted IS NULL ORDER BY enqueued").fetchall()
+        # Requests a session already has running count as turns it has taken
+        seen = dict(self._db.execute("SELECT session, COUNT(*) FROM tickets WHERE admitted IS NOT NULL GROUP BY session").fetchall())
+        # Within a turn, the session served least recently goes first
+        served = dict(self._db.execute("SELECT session, admitted FROM served").fetchall())
+        ranked = []
+        for order, (ticket, session) in enumerate(rows):
+            turn = seen.get(session, 0)
+            seen[session] = turn + 1
+            ranked.append((turn, served.get(session, 0.0), order, ticket))
+        return [ranked_ticket[-1] for ranked_ticket in sorted(ranked)]
+
+    def enqueue(self, session: str, tokens: int) -> str:
+        """Join the queue and return the ticket"""
+        ticket = uuid.uuid4().hex
+
+        def work(now):
+            self._db.execute(
+                "INSERT INTO tickets (ticket, session, tokens, enqueued, heartbeat) VALUES (?, ?, ?, ?, ?)",
+                (ticket, session, tokens, now, now)
+            )
+        self._transaction(work)
+        with self._lock:
+            self._held[ticket] = (session, tokens)
+            if self._renewer is None:
+                self._renewer = threading.Thread(target=self._renew_leases, name="smollm3-admission", daemon=True)
+                self._renewer.start()
+        return ticket
+
+    def _renew_leases(self):
+        """Keep the leases of this process's admitted tickets fresh while their requests run"""
+        while True:
+            time.sleep(self.lease / 3)
+            with self._lock:
+                tickets = list(self._held)
+            if tickets:
+                def work(now):
+                    self._db.executemany(
+                        "UPDATE tickets SET heartbeat = ? WHERE ticket = ? AND admitted IS NOT NULL",
+                        [(now, ticket) for ticket in tickets]
+                    )
+                try:
+                    self._transaction(work)
+                except sqlite3.Error:
+                    # Busy database; the next round renews in time since it runs well before expiry
+                    pass
+
+    def try_admit(self, ticket: str) -> Dict[str, Any]:
+        """Admit the ticket if a slot and budget are free; otherwise report its queue position and estimated wait"""
+        with self._lock:
+            held_session, held_tokens = self._held.get(ticket, ("", 0))
+
+        def work(now):
+            # Reclaim slots and places held by processes that went away
+            self._db.execute("DELETE FROM tickets WHERE admitted IS NULL AND heartbeat < ?", (now - WAITER_STALE_SECONDS,))
+            self._db.execute("DELETE FROM tickets WHERE admitted IS NOT NULL AND heartbeat < ?", (now - self.lease,))
+            self._db.execute("DELETE FROM served WHERE admitted < ?", (now - self.lease,))
+            row = self._db.execute("SELECT tokens, admitted FROM tickets WHERE ticket = ?", (ticket,)).fetchone()
+            if row is None:
+                # Expired while we were not polling (e.g. the process was suspended); rejoin at the back
+                # under the same session and reservation so fairness and token accounting still hold
+                self._db.execute(
+                    "INSERT INTO tickets (ticket, session, tokens, enqueued, heartbeat) VALUES (?, ?, ?, ?, ?)",
+                    (ticket, held_session, held_tokens, now, now)
+                )
+                row = (held_tokens, None)
+            tokens, admitted = row
+            if admitted is not None:
+                return {"admitted": True}
+            self._db.execute("UPDATE tickets SET heartbeat = ? WHERE ticket = ?", (now, ticket))
+
+            active = self._db.execute("SELECT COUNT(*) FROM tickets WHERE admitted IS NOT NULL").fetchone()[0]
+            waiting = self._waiting()
+            position = waiting.index(ticket)
+            free = self.max_concurrency - active
+            needed = {"requests": 1, "tokens": tokens}
+            levels = {name: self._bucket_level(name, now) for name in self.buckets}
+            # A request larger than a whole bucket waits for a full one instead of forever
+            charges = {name: min(needed[name], self.buckets[name]) for name in self.buckets}
+
+            if position < free and all(levels[name] >= charges[name] for name in self.buckets):
+                for name in self.buckets:
+                    self._set_bucket(name, levels[name] - charges[name], now)
+                self._db.execute("UPDATE tickets SET admitted = ?, heartbeat = ?, tokens = ? WHERE ticket = ?", (now, now, charges.get("tokens", 0), ticket))
+                self._db.execute("INSERT OR REPLACE INTO served (session, admitted) SELECT session, ? FROM tickets WHERE ticket = ?", (now, ticket))
+                return {"admitted": True}
+
+            slot_wait = (position - free + 1) / self.max_concurrency * self._hold_seconds() if position >= free else 0.0
+            bucket_wait = max([(charges[name] - levels[name]) * 60 / self.buckets[name] for name in self.buckets] + [0.0])
+            return {
+                "admitted": False,
+                "position": position + 1,
+                "queued": len(waiting),
+                "active": active,
+                "eta": max(slot_wait, bucket_wait),
+            }
+        return self._transaction(work)
+
+    def release(self, ticket: str, used_tokens: int | None = None):
+        """Free the ticket's slot and refund the part of its token reservation it did not use"""
+        with self._lock:
+            self._held.pop(ticket, None)
+
+        def work(now):
+            row = self._db.execute("SELECT tokens, admitted FROM tickets WHERE ticket = ?", (ticket,)).fetchone()
+            self._db.execute("DELETE FROM tickets WHERE ticket = ?", (ticket,))
+            if row is None or row[1] is None:
+                return
+            reserved, admitted = row
+            if "tokens" in self.buckets and used_tokens is not None and used_tokens < reserved:
+                level = self._bucket_level("tokens", now)
+                self._set_bucket("tokens", min(self.buckets["tokens"], level + reserved - used_tokens), now)
+            hold = (1 - HOLD_EWMA_ALPHA) * self._hold_seconds() + HOLD_EWMA_ALPHA * (now - admitted)
+            self._db.execute("INSERT OR REPLACE INTO state (name, value) VALUES ('hold_seconds', ?)", (hold,))
+        self._transaction(work)
+
+    def acquire(self, session: str, tokens: int, on_wait: Callable[[Dict[str, Any]], None] | None = None, timeout: float = QUEUE_TIMEOUT, cancel: threading.Event | None = None) -> str:
+        """Block until admitted and return the ticket to release
+
+        Raises InferenceError after timeout seconds in the queue, or as soon as
+        cancel is set; either way the ticket leaves the queue.
+        """
+        ticket = self.enqueue(session, tokens)
+        started = time.monotonic()
+        waited = False
+        try:
+            while True:
+                status = self.try_admit(ticket)
+                elapsed = time.monotonic() - started
+                if status["admitted"]:
+                    with self._lock:
+                        self.admitted += 1
+                        self.queued += waited
+                        self.wait_seconds += elapsed
+                    return ticket
+                if elapsed >= timeout:
+                    raise InferenceError(RATE_LIMITED, f"Waited {elapsed:.0f}s in the request queue (position {status['position']})")
+                if cancel is not None and cancel.is_set():
+                    raise InferenceError(CANCELLED, f"Cancelled after {elapsed:.0f}s in the request queue")
+                waited = True
+                if on_wait:
+                    on_wait(dict(status, kind=QUEUED, elapsed=elapsed))
+                if cancel is not None:
+                    cancel.wait(POLL_SECONDS)
+                else:
+                    time.sleep(POLL_SECONDS)
+        except BaseException:
+            self.release(ticket)
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        """Global slot and queue occupancy plus this process's admission counters"""
+        with self._lock:
+            active, waiting = self._db.execute(
+                "SELECT COUNT(admitted), COUNT(*) - COUNT(admitted) FROM tickets"
+            ).fetchone()
+            admitted, queued, wait_seconds = self.admitted, self.queued, self.wait_seconds
+        return {
+            "active": active,
+            "waiting": waiting,
+            "max_concurrency": self.max_concurrency,
+            "admitted": admitted,
+            "queued": queued,
+            "avg_wait": wait_seconds / admitted if admitted else 0.0,
+        }
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission() -> AdmissionController | None:
+    """Return the process-wide admission controller, or None when SMOLLM3_ADMISSION=0"""
+    global _controller
+    if not ADMISSION_ENABLED:
+        return None
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController()
+        return _controller
@@ -1,16 +1,48 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import os
-from openai import OpenAI
 import time
-import re
-from typing import Generator, Dict, Any
+import asyncio
+import hashlib
+import uuid
+import bisect
+import secrets
+from typing import Dict, Any
 from dotenv import load_dotenv
 
-# Import cost calculator
-from cost_calculator import cost_calculator_page
+# Load environment variables from .env before the modules below read their settings
+@st.cache_resource
+def load_environment():
+    """Read the .env file once per server process rather than on every rerun"""
+    load_dotenv()
 
-# Load environment variables from .env file
-load_dotenv()
+load_environment()
+
+from client_pool import get_client_pool
+from thinking_parser import ThinkingStreamParser
+from render_scheduler import RenderScheduler
+from context_window import CONTEXT_LIMIT, STRATEGIES, message_tokens, select_context
+from compare import DEFAULT_CONFIGS, config_params, run_comparison
+from response_cache import get_response_cache, make_cache_key, is_deterministic, replay
+from warmer import start_warmer, get_warmer
+from metrics import RequestTimer, MetricsRing, SavingsCounter, get_process_metrics, get_process_savings
+from retry import CANCELLED, COLD_START, RATE_LIMITED, InferenceError
+from admission import QUEUED, get_admission
+from single_flight import COALESCE, get_single_flight
+from hedge import HEDGING, get_hedger
+from generation import Generation, get_journals
+from stream_component import DeltaStream
+from conversation_store import compress_text, decompress_text, get_conversation_store
+from inference import ENDPOINTS, MODEL, create_openai_client, get_response, get_router, build_api_params
+
+# Messages rendered by default and per "Load earlier" page (overridable through .env)
+HISTORY_WINDOW = int(os.getenv("SMOLLM3_HISTORY_WINDOW") or 20)
+# How often the streaming region redraws a running reply
+STREAM_TICK_SECONDS = float(os.getenv("SMOLLM3_STREAM_TICK") or 0.2)
+# Cookie holding the secret that proves this browser owns the session in the URL
+SECRET_COOKIE = "smollm3_secret"
+# Show operator views (memory of every session in the process) to all users; off by default
+ADMIN_VIEWS = os.getenv("SMOLLM3_ADMIN_VIEWS") == "1"
 
 # Page configuration
 st.set_page_config(
@@ -19,316 +51,72 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS for dark theme and styling
-st.markdown("""
-    <style>
-    html, body, .stApp {
-        background-color: #161616; 
-        height: 100%;
-        margin: 0;
-        padding: 0;
-    }
-    .stApp {
-        display: flex;
-        flex-direction: column;
-        min-height: 100vh;
-    }
-    .tagline {
-        font-size: 20px;
-        font-weight: bold;
-        color: #FFFFFF;
-        text-align: center;
-        margin-top: -10px;
-        margin-bottom: 20px;
-    }
-    .subtagline {
-        font-size: 19px;
-        color: #FFFFFF;
-        text-align: center;
-        padding:20px;
-        margin-bottom: 20px;
-    }
-     .header {
-        font-size: 39px;
-        font-weight: bold;
-        color: #FFFFFF;
-        text-align: center;
-        margin-top: -10px;
-        margin-bottom: 10px;
-    }
-    .stChat > div {
-        padding-top: 1rem;
-    }
-    .chat-message {
-        flex-direction: row-reverse;
-        padding: 1rem;
-        border-radius: 1.5rem;
-        margin-bottom: 1rem;
-        display: flex;
-        align-items: flex-center;
-        background-color: rgba(255, 255, 255, 0.05);
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        box-shadow: 0px 0.84px 0px 0px #FFFFFF14 inset;
-        box-shadow: 2px 2px 19px 0px #FFFFFF1A;
-    }
-    .chat-message.user {
-        margin-top:10px;
-        background: linear-gradient(180deg, rgba(17, 17, 17, 0.02) 0%, rgba(32, 32, 32, 0.02) 100%);
-        border: 0.84px solid var(--light-dark-1004, #FFFFFF0A)
-        display: inline-block; 
-        
-    }
-    .chat-message.assistant {
-        background: linear-gradient(180deg, rgba(17, 17, 17, 0.02) 0%, rgba(32, 32, 32, 0.02) 100%),
-        linear-gradient(0deg, rgba(82, 82, 82, 0.2), rgba(82, 82, 82, 0.2));
-        margin: 10px 0;
-       
-    }
-    .chat-message .avatar {
-        width: 40px;
-        height: 40px;
-        border-radius: 50%;
-        margin: 0 10px;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        font-weight: bold;
-        background: linear-gradient(180deg, rgba(17, 17, 17, 0.02) 0%, rgba(32, 32, 32, 0.02) 100%),
-        linear-gradient(0deg, rgba(82, 82, 82, 0.2), rgba(82, 82, 82, 0.2));
-        color: #FFFFFF;
-    }
-    .chat-message.user .avatar {
-        background: linear-gradient(180deg, rgba(17, 17, 17, 0.02) 0%, rgba(32, 32, 32, 0.02) 100%),
-        linear-gradient(0deg, rgba(82, 82, 82, 0.2), rgba(82, 82, 82, 0.2));
-        color: #FFFFFF;
-    }
-    .thinking-text {
-        color: #cccccc;
-        font-style: italic;
-        font-weight: normal;
-        padding: 8px;
-        border-left: 3px solid #666;
-        border-radius: 4px;
-        background: linear-gradient(180deg, rgba(17, 17, 17, 0.02) 0%, rgba(32, 32, 32, 0.02) 100%),
-        linear-gradient(0deg, rgba(82, 82, 82, 0.2), rgba(82, 82, 82, 0.2));
-        margin: 10px 0;
-        
-    }
-    .default-container{
-        padding: 1rem;
-        border-radius: 1.5rem;
-        margin-bottom: 1rem;
-        display: flex;
-        align-items: flex-center;
-        background-color: rgba(255, 255, 255, 0.05);
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        box-shadow: 0px 0.84px 0px 0px #FFFFFF14 inset;
-        box-shadow: 2px 2px 19px 0px #FFFFFF1A;
-    }
-    .response-text {
-        color: white;
-        font-weight: normal;
-    }
-    .stSidebar{
-        background: linear-gradient(304deg, #1C1C1C 41.52%, rgba(63, 63, 63, 0) 100%);
-        backdrop-filter: blur(87.27272033691406px)
-        box-shadow: 0px 0.84px 0px 0px #FFFFFF14 inset;
-        box-shadow: 2px 2px 19px 0px #FFFFFF1A;
-    }
-     div[data-baseweb="select"] > div {
-        box-shadow: 0px 0.84px 0px 0px #FFFFFF14 inset;
-        box-shadow: 2px 2px 19px 0px #FFFFFF1A;
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        background-color:#2B2B2B;
-    }
-    div[data-baseweb="popover"] li {
-        background-color: black;
-    }
-    div[data-baseweb="popover"] li:hover {
-        background-color: #2B2B2B;
-    }
-    .sidebar-section {
-        padding: 1rem;
-        border-radius: 0.5rem;
-        margin-bottom: 1rem;
-        background: linear-gradient(105.13deg, #292929 41.52% 41.52% , rgba(63, 63, 63, 0) 100%);
-        backdrop-filter: blur(87.27272033691406px)
+# Dark theme, served once as static/theme.css (see .streamlit/config.toml) and cached by the browser;
+# each run only sends this import, which lands in the event container and takes no space on the page
+st.html('<style>@import url("app/static/theme.css");</style>')
 
-    }
-    .stTextInput > div > div > input {
-        background-color: rgba(255, 255, 255, 0.1);
-        color: white;
-        border: 1px solid rgba(255, 255, 255, 0.2);
-    }
-    .stSelectbox > div > div > div {
-        background-color: rgba(255, 255, 255, 0.1);
-        color: white;
-    }
-    .stSlider > div > div > div > div {
-        color: #65daff;
-    }
-     header[data-testid="stHeader"] {
-        background-color: #38383880;
-    }
-    
-    div[data-baseweb="notification"] {
-        background: linear-gradient(105.13deg, #1C1C1C 41.52%, rgba(63, 63, 63, 0) 100%);
-        color: white; 
-        border: 2px solid var(--light-dark-1004, #FFFFFF0A);
-        border-radius: 16px; 
-        padding: 12px; 
-    }
-    .stSidebar div[data-baseweb="textarea"] {
-        background: linear-gradient(105.13deg, #1C1C1C 41.52%, rgba(63, 63, 63, 0) 100%);
-        color: white; 
-        border: 2px solid var(--light-dark-1004, #FFFFFF0A);
-        border-radius: 16px; 
-        padding: 12px; 
-    }
-    .stSidebar div[data-baseweb="base-input"] {
-         background-color: transparent;
-    }
-    .stSidebar button {
-        background: linear-gradient(105.13deg, #1C1C1C 41.52%, rgba(63, 63, 63, 0) 100%);
-        color: white; 
-        border: 2px solid var(--light-dark-1004, #FFFFFF0A);
-        border-radius: 16px; 
-        padding: 8px; 
-    }
-    .st-emotion-cache-hzygls  {
-        background-color: #161616 !important; 
-        border: none !important; 
-    }
-    .st-emotion-cache-x1bvup  {
-        background: #38383880 !important;
-        border: 2px solid var(--light-dark-1004, #FFFFFF0A);
-        background: linear-gradient(105.13deg, #1C1C1C 41.52%, rgba(63, 63, 63, 0) 100%);
-    }
-    
-    .st-emotion-cache-x1bvup textarea {
-        background-color: transparent;
-    }
-    .st-emotion-cache-x1bvup .st-f9{
-        background-color: transparent;
-    }
-    .st-emotion-cache-x1bvup .st-f8{
-        background-color: transparent;
-    }
-    .st-emotion-cache-x1bvup:focus-within{
-        box-shadow: 0px 0.84px 0px 0px #FFFFFF14 inset;
-        box-shadow: 2px 2px 19px 0px #FFFFFF1A;
-        border: 1px solid rgba(255, 255, 255, 0.1);
-    }
-    .st-emotion-cache-liupih{
-        padding-bottom: 25px;
-    }
-    .st-emotion-cache-19cfm8f{
-       background: linear-gradient(105.13deg, #1C1C1C 41.52%, rgba(63, 63, 63, 0) 100%);
-        color: white; 
-        border: 2px solid var(--light-dark-1004, #FFFFFF0A);
-        border-radius: 16px; 
-        padding: 12px; 
-    }
-    .st-emotion-cache-19cfm8f div{
-        background-color: transparent;
-    }
-     .st-emotion-cache-19cfm8f div button{
-        background-color: transparent;
-    }
-    .stSidebar .stTextInput  div[data-baseweb="base-input"] input {
-        background-color: transparent ;
-        border: none 
-    }
-    .stSidebar .stTextInput  div[data-baseweb="base-input"] button {
-        border: none 
-    }
-    .stSidebar .stTextInput  div[data-baseweb="input"] {
-        border: 2px solid var(--light-dark-1004, #FFFFFF0A);
-        background: linear-gradient(105.13deg, #1C1C1C 41.52%, rgba(63, 63, 63, 0) 100%);
-    }
-    .st-emotion-cache-1hiktyo:hover:enabled, .st-emotion-cache-1hiktyo:focus:enabled {
-        background: linear-gradient(105.13deg, #292929 41.52% 41.52% , rgba(63, 63, 63, 0) 100%) !important
-    }
-    </style>
-    """, unsafe_allow_html=True)
+def remember_session_secret(secret: str):
+    """Store the browser's session secret in a cookie so a refresh can prove it owns the session in the URL"""
+    components.html(
+        f'<script>parent.document.cookie = "{SECRET_COOKIE}={secret}; path=/; max-age=31536000; SameSite=Strict"'
+        f' + (parent.location.protocol === "https:" ? "; Secure" : "");</script>',
+        height=0,
+    )
 
 def initialize_session_state():
     """Initialize session state variables"""
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
+    if "session_secret" not in st.session_state:
+        # Per-browser secret kept in a cookie, never in the URL
+        st.session_state.session_secret = st.context.cookies.get(SECRET_COOKIE) or secrets.token_urlsafe(32)
+    if SECRET_COOKIE not in st.context.cookies:
+        remember_session_secret(st.session_state.session_secret)
+    if "session_id" not in st.session_state:
+        # Identifies this chat in the request queue and the generation journal; kept in the URL
+        # so a browser refresh reattaches to the same conversation and any running reply. The id
+        # alone is not enough: a link opened without the owner's secret starts a new session.
+        session_id = st.query_params.get("session")
+        if session_id and not get_conversation_store().claim_session(session_id, st.session_state.session_secret):
+            st.toast("That chat link belongs to another browser, so a new chat was started.")
+            session_id = None
+        if not session_id:
+            session_id = uuid.uuid4().hex
+            get_conversation_store().claim_session(session_id, st.session_state.session_secret)
+        st.query_params["session"] = session_id
+        st.session_state.session_id = session_id
+    if "metrics" not in st.session_state:
+        # Timings of this session's requests; the process-wide buffer lives in metrics.py
+        st.session_state.metrics = MetricsRing()
+    if "savings" not in st.session_state:
+        # Tokens and time saved by this session's Stop clicks
+        st.session_state.savings = SavingsCounter()
+    if "history_pages" not in st.session_state:
+        # Store ids where the shown history starts and where each loaded earlier page starts (newest first)
+        st.session_state.history_start = None
+        st.session_state.history_pages = []
+        st.session_state.history_conversation = None
     if "api_key" not in st.session_state:
         # Try to get from environment variable first
         env_token = os.getenv("HF_TOKEN")
         st.session_state.api_key = env_token if env_token else ""
 
-def create_openai_client(api_key: str) -> OpenAI:
-    """Create OpenAI client with custom base URL"""
-    return OpenAI(
-        base_url="https://av7tzsihe44dbvby.us-east-1.aws.endpoints.huggingface.cloud/v1/",
-        api_key=api_key
-    )
-
-def get_response(client: OpenAI, messages: list, params: Dict[str, Any], stream: bool = True) -> Generator[str, None, None] | str:
-    """Get response from the API, either streaming or non-streaming"""
-    try:
-        chat_completion = client.chat.completions.create(
-            model="HuggingFaceTB/SmolLM3-3B",
-            messages=messages,
-            stream=stream,
-            **params
-        )
-        
-        if stream:
-            for chunk in chat_completion:
-                if hasattr(chunk.choices[0].delta, 'content') and chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
-        else:
-            return chat_completion.choices[0].message.content
-                
-    except Exception as e:
-        if stream:
-            yield f"Error: {str(e)}"
-        else:
-            return f"Error: {str(e)}"
-
 def parse_thinking_and_response(text: str) -> tuple[str, str]:
     """Parse thinking and response from text"""
-    # Look for thinking patterns like <thinking>...</thinking> or similar
-    thinking_patterns = [
-        r'<thinking>(.*?)</thinking>',
-        r'<think>(.*?)</think>',
-        r'\*thinking\*(.*?)\*/thinking\*',
-        r'\[thinking\](.*?)\[/thinking\]'
-    ]
-    
-    thinking = ""
-    response = text
-    
-    for pattern in thinking_patterns:
-        matches = re.findall(pattern, text, re.DOTALL | re.IGNORECASE)
-        if matches:
-            thinking = matches[0].strip()
-            response = re.sub(pattern, '', text, flags=re.DOTALL | re.IGNORECASE).strip()
-            break
-    
-    return thinking, response
-
-def display_chat_message(role: str, content: str, show_thinking: bool = True):
-    """Display a chat message with custom styling and thinking separation"""
+    parser = ThinkingStreamParser()
+    parser.feed(text)
+    parser.close()
+    return parser.result()
+
+def format_chat_message(role: str, thinking: str, response: str) -> str:
+    """Build the HTML for a chat message from already separated thinking and response"""
     avatar = "U" if role == "user" else "A"
     css_class = "user" if role == "user" else "assistant"
     
-    if role == "assistant" and show_thinking:
-        thinking, response = parse_thinking_and_response(content)
-        
-        content_html = ""
-        if thinking:
-            content_html += f'<div class="thinking-text">Thinking: {thinking}</div>'
-        content_html += f'<div class="response-text">{response}</div>'
-    else:
-        content_html = f'<div class="response-text">{content}</div>'
+    content_html = ""
+    if thinking:
+        content_html += f'<div class="thinking-text">Thinking: {thinking}</div>'
+    content_html += f'<div class="response-text">{response}</div>'
     
-    st.markdown(f"""
+    return f"""
     <div class="chat-message {css_class}">
         <div class="avatar">{avatar}</div>
         <div style="flex: 1;">
@@ -338,172 +126,658 @@ def display_chat_message(role: str, content: str, show_thinking: bool = True):
             {content_html}
         </div>
     </div>
-    """, unsafe_allow_html=True)
+    """
 
-def chat_page():
-    """Chat interface page"""
-    st.markdown('<div class="header">Trex1.6</div>', unsafe_allow_html=True)
-    # st.markdown('<div class="tagline">Advanced AI Chat with Customizable Parameters</div>', unsafe_allow_html=True)
-    # st.markdown('<div class="subtagline">Chat with trex1.6 model with full parameter control</div>', unsafe_allow_html=True)
+def make_message(role: str, content: str, thinking: str | None = None, response: str | None = None) -> Dict[str, Any]:
+    """Create a finalized chat message with its content hash and parsed parts stored once"""
+    if thinking is None:
+        if role == "assistant":
+            thinking, response = parse_thinking_and_response(content)
+        else:
+            thinking, response = "", content
+    message = {
+        "role": role,
+        "content": content,
+        "hash": hashlib.sha1(content.encode("utf-8")).hexdigest(),
+        # Only needed when the message is rendered, so kept compressed
+        "thinking": compress_text(thinking),
+        "response": response,
+    }
+    message_tokens(message)
+    return message
 
-   
-    # Sidebar for API configuration and parameters
-    with st.sidebar:
-        st.header("Configuration")
-        
-        # API Key section
-        st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
-        st.subheader("API Authentication")
-        
-        # Check if token is available from environment
-        env_token = os.getenv("HF_TOKEN")
-        if env_token and not st.session_state.api_key:
-            st.session_state.api_key = env_token
-        
-        if st.session_state.api_key:
-            if env_token:
-                st.success("Using HF_TOKEN from .env file")
-                # Show option to override with manual input
-                manual_override = st.checkbox("Override with manual token", value=False)
-                if manual_override:
-                    api_key = st.text_input(
-                        "Hugging Face Token",
-                        type="password",
-                        value="",
-                        help="Enter your Hugging Face API token to override .env file"
-                    )
-                    if api_key:
-                        st.session_state.api_key = api_key
-                else:
-                    api_key = st.session_state.api_key
+def get_message_html(message: Dict[str, Any], show_thinking: bool) -> str:
+    """Return the cached HTML of a finalized message, rendering it only on first use"""
+    if "hash" not in message:
+        message.update(make_message(message["role"], message["content"]))
+    
+    key = (message["hash"], show_thinking)
+    html = st.session_state.html_cache.get(key)
+    if html is None:
+        if message["role"] == "assistant" and show_thinking:
+            html = format_chat_message(message["role"], decompress_text(message["thinking"]), message["response"])
+        else:
+            html = format_chat_message(message["role"], "", message["content"])
+        st.session_state.html_cache[key] = html
+    return html
+
+def display_comparison_results(comparison: Dict[str, Any], show_thinking: bool):
+    """Show a finished comparison run as side-by-side columns with per-stream metrics"""
+    st.markdown(format_chat_message("user", "", comparison["prompt"]), unsafe_allow_html=True)
+    columns = st.columns(len(comparison["results"]))
+    for column, config, result in zip(columns, comparison["configs"], comparison["results"]):
+        with column:
+            st.markdown(f"**{config['name']}**")
+            if show_thinking:
+                thinking, response = parse_thinking_and_response(result["text"])
+            else:
+                thinking, response = "", result["text"]
+            if result["error"]:
+                response += f"\n\nError: {result['error']}"
+            st.markdown(format_chat_message("assistant", thinking, response), unsafe_allow_html=True)
+            st.caption(comparison_caption(result))
+    st.caption(f"Wall time {comparison['wall_time']:.1f}s vs "
+               f"{sum(r['duration'] for r in comparison['results']):.1f}s if run one after another")
+
+def comparison_caption(result: Dict[str, Any]) -> str:
+    """One-line TTFT / throughput summary for a comparison stream"""
+    ttft = f"{result['ttft']:.2f}s" if result["ttft"] is not None else "n/a"
+    return (f"TTFT {ttft} | {result['tokens_per_sec']:.1f} tok/s | "
+            f"{result['tokens']} tokens in {result['duration']:.1f}s")
+
+def run_comparison_view(prompt: str, messages: list, configs: list, base_params: Dict[str, Any], max_concurrency: int, show_thinking: bool) -> Dict[str, Any]:
+    """Stream the conversation to every comparison config at once, one column per config"""
+    param_sets = [config_params(config, base_params) for config in configs]
+    texts = [""] * len(configs)
+    parsers = [ThinkingStreamParser() for _ in configs]
+    placeholders = []
+    
+    st.markdown(format_chat_message("user", "", prompt), unsafe_allow_html=True)
+    for column, config in zip(st.columns(len(configs)), configs):
+        with column:
+            st.markdown(f"**{config['name']}**")
+            placeholders.append(st.empty())
+    
+    def make_render(index: int):
+        """Build the frame renderer for one column"""
+        def render_frame(final: bool):
+            if show_thinking:
+                thinking, response = parsers[index].result()
             else:
-                st.success("API token configured")
+                thinking, response = "", texts[index]
+            cursor = "" if final else "▌"
+            with placeholders[index]:
+                st.markdown(format_chat_message("assistant", thinking, response + cursor), unsafe_allow_html=True)
+        return render_frame
+    
+    schedulers = [RenderScheduler(make_render(index)) for index in range(len(configs))]
+    
+    def on_chunk(index: int, chunk: str):
+        texts[index] += chunk
+        parsers[index].feed(chunk)
+        schedulers[index].push(chunk)
+    
+    def on_tick():
+        # Draws text a stalled stream left waiting for its next frame
+        for scheduler in schedulers:
+            scheduler.tick()
+    
+    started = time.perf_counter()
+    results = asyncio.run(run_comparison(
+        get_router(), st.session_state.api_key, messages, param_sets, on_chunk, max_concurrency,
+        session=st.session_state.session_id,
+        on_tick=on_tick if schedulers[0].min_interval else None,
+        tick_seconds=schedulers[0].min_interval
+    ))
+    wall_time = time.perf_counter() - started
+    
+    for parser, scheduler in zip(parsers, schedulers):
+        parser.close()
+        scheduler.finish()
+    
+    return {"prompt": prompt, "configs": configs, "results": results, "wall_time": wall_time}
+
+def display_message_metrics(metrics: Dict[str, Any]):
+    """Collapsible panel with the timings of the request that produced a message"""
+    def seconds(value):
+        return f"{value:.2f}s" if value is not None else "n/a"
+    
+    with st.expander("Request metrics", expanded=False):
+        st.write(f"• Connect: {seconds(metrics['connect'])} | TTFT: {seconds(metrics['ttft'])} | "
+                 f"First response token: {seconds(metrics['ttft_response'])}")
+        st.write(f"• Total: {seconds(metrics['total'])} | {metrics['tokens_per_sec']:.1f} tokens/sec")
+        estimated = " (estimated)" if metrics["prompt_tokens_estimated"] else ""
+        st.write(f"• Prompt tokens: {metrics['prompt_tokens']}{estimated} | Completion tokens: {metrics['completion_tokens']}")
+        histogram = ", ".join(f"{label}: {count}" for label, count in metrics["itl_histogram"].items() if count)
+        st.write(f"• Inter-token latency: {histogram or 'n/a'}")
+        if "tokens_saved" in metrics:
+            st.write(f"• Stopped early: ~{metrics['tokens_saved']} tokens and ~{metrics['seconds_saved']:.1f}s saved")
+
+def display_message_footer(message: Dict[str, Any]):
+    """Truncation note and request metrics shown under a message"""
+    if message.get("truncated"):
+        st.caption("⏹️ Stopped early; the reply is truncated.")
+    if "metrics" in message:
+        display_message_metrics(message["metrics"])
+
+def message_index(messages: list, message_id: int) -> int:
+    """Position of the message with the given store id (ids increase along a conversation)"""
+    return bisect.bisect_left(messages, message_id, key=lambda m: m["id"])
+
+def load_earlier_history(journal):
+    """Add a page of HISTORY_WINDOW messages above the oldest one shown, reading it from the store if needed"""
+    messages = journal.messages
+    pages = st.session_state.history_pages
+    if st.session_state.history_start is None:
+        # Pin the default window where it is so the pages above it keep their boundaries
+        st.session_state.history_start = messages[max(0, len(messages) - HISTORY_WINDOW)]["id"]
+    index = message_index(messages, pages[-1] if pages else st.session_state.history_start)
+    if index < HISTORY_WINDOW:
+        index += journal.load_earlier(limit=HISTORY_WINDOW - index)
+    if index:
+        pages.append(messages[max(0, index - HISTORY_WINDOW)]["id"])
+
+def display_history(journal, active: Generation | None, show_thinking: bool):
+    """Render the newest HISTORY_WINDOW messages plus the earlier pages the user asked for
+
+    Each earlier page is drawn in a container nested above the previous one,
+    so loading a page adds elements without moving the ones already on
+    screen and the browser keeps the scroll position.
+    """
+    messages = journal.messages
+    if st.session_state.history_conversation != journal.conversation:
+        st.session_state.history_conversation = journal.conversation
+        st.session_state.history_start = None
+        st.session_state.history_pages = []
+    pages = st.session_state.history_pages
+    if st.session_state.history_start is None:
+        start = max(0, len(messages) - HISTORY_WINDOW)
+    else:
+        start = message_index(messages, st.session_state.history_start)
+    
+    top = st.container()
+    earlier = st.container()
+    recent = st.container()
+    with top:
+        first = message_index(messages, pages[-1]) if pages else start
+        if first > 0 or journal.has_earlier:
+            st.button("⬆️ Load earlier messages", key="load_earlier", on_click=load_earlier_history, args=(journal,))
+    
+    end = start
+    container = earlier
+    for page_start in pages:
+        begin = message_index(messages, page_start)
+        with container:
+            container = st.container()
+            for message in messages[begin:end]:
+                st.markdown(get_message_html(message, show_thinking), unsafe_allow_html=True)
+                display_message_footer(message)
+        end = begin
+    
+    with recent:
+        for message in messages[start:]:
+            if active is not None and message is active.message:
+                # Drawn below by attach_generation
+                continue
+            st.markdown(get_message_html(message, show_thinking), unsafe_allow_html=True)
+            display_message_footer(message)
+
+def display_metrics_summary(label: str, summary: Dict[str, Any]):
+    """One sidebar line of p50/p95/p99 TTFT and total latency"""
+    if "ttft" not in summary:
+        return
+    ttft = summary["ttft"]
+    total = summary["total"]
+    st.write(f"• {label} ({summary['count']} requests): TTFT p50/p95/p99 "
+             f"{ttft['p50']:.2f}/{ttft['p95']:.2f}/{ttft['p99']:.2f}s, total "
+             f"{total['p50']:.1f}/{total['p95']:.1f}/{total['p99']:.1f}s")
+
+def display_request_status(placeholder, event: Dict[str, Any]):
+    """Show queue position, or warm-up / backoff progress while a request is being retried"""
+    if event["kind"] == QUEUED:
+        with placeholder.container():
+            st.markdown(f'<div class="default-container"><div style="color: #cccccc; font-style: italic;">Waiting for a free slot: position {event["position"]} of {event["queued"]} in the queue, about {event["eta"]:.0f}s left ({event["elapsed"]:.0f}s elapsed)...</div></div>', unsafe_allow_html=True)
+        return
+    if event["kind"] == COLD_START:
+        label = "Endpoint warming up"
+    elif event["kind"] == RATE_LIMITED:
+        label = "Endpoint is rate limiting requests"
+    else:
+        label = "Endpoint timed out"
+    with placeholder.container():
+        st.markdown(f'<div class="default-container"><div style="color: #cccccc; font-style: italic;">{label}, retrying in {event["delay"]:.0f}s (attempt {event["attempt"]}, {event["elapsed"]:.0f}s elapsed)...</div></div>', unsafe_allow_html=True)
+        st.progress(min(1.0, (event["elapsed"] + event["delay"]) / event["deadline"]))
+
+def show_generation_progress(generation: Generation, status: Dict[str, Any] | None):
+    """Typing indicator, or retry / queue progress when there is any"""
+    if status is not None:
+        display_request_status(st.empty(), status)
+    else:
+        indicator = "trex1.6 is typing..." if generation.streaming else "trex1.6 is generating response..."
+        st.markdown(f'<div class="default-container"><div style="color: #cccccc; font-style: italic;">{indicator}</div></div>', unsafe_allow_html=True)
+
+@st.fragment(run_every=STREAM_TICK_SECONDS)
+def follow_generation(show_thinking: bool):
+    """Redraw the running reply from the journal every STREAM_TICK_SECONDS
+
+    A tick touches only this fragment and returns straight away, so Stop,
+    paging and sidebar clicks are handled between ticks rather than after
+    the stream. Once the reply is finished the whole page reruns to show it.
+    """
+    generation = get_journals().get(st.session_state.session_id).generation
+    if generation is None or generation.reported:
+        return
+    if generation.done:
+        st.rerun()
+    
+    # Only chunks that arrived since the last tick are parsed
+    follow = st.session_state.get("follow")
+    if follow is None or follow["id"] != generation.id:
+        follow = st.session_state.follow = {"id": generation.id, "index": 0, "chunks": [], "parser": ThinkingStreamParser(), "frames": 0, "views": {}}
+    chunks, status, _, _ = generation.wait(follow["index"], -1, timeout=0)
+    for chunk in chunks:
+        follow["parser"].feed(chunk)
+    follow["chunks"].extend(chunks)
+    follow["index"] += len(chunks)
+    follow["frames"] += bool(chunks)
+    
+    if follow["index"]:
+        if show_thinking:
+            thinking, response = follow["parser"].result()
+        else:
+            thinking, response = "", "".join(follow["chunks"])
+        # The browser appends just the new text; toggling thinking starts a fresh frame
+        view = follow["views"].get(show_thinking)
+        if view is None:
+            view = follow["views"][show_thinking] = DeltaStream(f"stream_{generation.id}_{int(show_thinking)}")
+        view.update(thinking, response)
+    else:
+        show_generation_progress(generation, status)
+    
+    # Clicking Stop reruns only this fragment, which cancels the generation; the next tick sees it finish
+    if generation.streaming and st.button("⏹️ Stop", key=f"stop_{generation.id}"):
+        generation.cancel()
+
+def display_generation_result(generation: Generation, show_thinking: bool):
+    """Show a finished background generation with its metrics or error"""
+    follow = st.session_state.get("follow")
+    if follow is not None and follow["id"] == generation.id:
+        # Ticks that drew new text versus chunks folded into them
+        st.session_state.render_stats = {
+            "chunks": follow["index"],
+            "frames_rendered": follow["frames"],
+            "frames_dropped": max(0, follow["index"] - follow["frames"]),
+            "chars_sent": sum(view.chars_sent for view in follow["views"].values()),
+            "chars": len(generation.text),
+        }
+    if generation.message is not None:
+        st.markdown(get_message_html(generation.message, show_thinking), unsafe_allow_html=True)
+        display_message_footer(generation.message)
+    elif generation.text:
+        thinking, response = parse_thinking_and_response(generation.text) if show_thinking else ("", generation.text)
+        st.markdown(format_chat_message("assistant", thinking, response), unsafe_allow_html=True)
+    if generation.error is not None:
+        st.error(f"Error: {str(generation.error)}")
+    generation.reported = True
+
+@st.fragment
+def chat_transcript(show_thinking: bool):
+    """Chat history as a fragment, so loading earlier messages reruns only the transcript"""
+    journal = get_journals().get(st.session_state.session_id)
+    generation = journal.generation
+    below = generation if generation is not None and generation.id == st.session_state.get("shown_below") else None
+    if journal.messages:
+        st.subheader("Chat Messages")
+        display_history(journal, below, show_thinking)
+    else:
+        st.info("Start a conversation with trex1.6! Enter your message below.")
+
+@st.fragment
+def chat_settings():
+    """Sidebar configuration, model parameters and stats
+
+    Runs as a fragment, so moving a slider reruns only the sidebar; the chosen
+    values are kept in st.session_state.chat_params for the next request.
+    """
+    st.header("Configuration")
+    
+    # API Key section
+    st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
+    st.subheader("API Authentication")
+    
+    # Check if token is available from environment
+    env_token = os.getenv("HF_TOKEN")
+    if env_token and not st.session_state.api_key:
+        st.session_state.api_key = env_token
+    
+    if st.session_state.api_key:
+        if env_token:
+            st.success("Using HF_TOKEN from .env file")
+            # Show option to override with manual input
+            manual_override = st.checkbox("Override with manual token", value=False)
+            if manual_override:
                 api_key = st.text_input(
                     "Hugging Face Token",
                     type="password",
-                    value=st.session_state.api_key,
-                    help="Enter your Hugging Face API token"
+                    value="",
+                    help="Enter your Hugging Face API token to override .env file"
                 )
-                st.session_state.api_key = api_key
+                if api_key:
+                    st.session_state.api_key = api_key
+            else:
+                api_key = st.session_state.api_key
         else:
-            st.warning("No API token found in .env file")
+            st.success("API token configured")
             api_key = st.text_input(
                 "Hugging Face Token",
                 type="password",
-                value="",
+                value=st.session_state.api_key,
                 help="Enter your Hugging Face API token"
             )
             st.session_state.api_key = api_key
-            
-        st.markdown('</div>', unsafe_allow_html=True)
-        
-        # Response Options section
-        st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
-        st.subheader("Response Options")
-        
-        # Stream parameter
-        enable_streaming = st.checkbox("Enable Streaming", value=True, help="Stream responses in real-time or get complete response at once")
-        
-        # Show thinking parameter
-        show_thinking = st.checkbox("Show Thinking Process", value=True, help="Display model's thinking process separately from the response")
-        
-        st.markdown('</div>', unsafe_allow_html=True)
-        
-        # Model parameters section
-        st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
-        st.subheader("Model Parameters")
-        
-        # Temperature
-        temperature = st.slider(
-            "Temperature",
-            min_value=0.0,
-            max_value=2.0,
-            value=0.7,
-            step=0.1,
-            help="Controls randomness. Higher values make output more creative, lower values more focused."
-        )
-        
-        # Top P
-        top_p = st.slider(
-            "Top P",
-            min_value=0.0,
-            max_value=1.0,
-            value=0.9,
-            step=0.05,
-            help="Controls diversity via nucleus sampling. Lower values focus on most likely tokens."
-        )
-        
-        # Max Tokens
-        max_tokens = st.number_input(
-            "Max Tokens",
-            min_value=1,
-            max_value=1000,
-            value=150,
-            step=10,
-            help="Maximum number of tokens to generate in the response."
-        )
-        
-        # Seed
-        use_seed = st.checkbox("Use Fixed Seed", value=False)
-        seed = None
-        if use_seed:
-            seed = st.number_input(
-                "Seed",
-                min_value=0,
-                max_value=1000000,
-                value=42,
-                step=1,
-                help="Seed for reproducible outputs."
-            )
-        
-        # Stop sequences
-        stop_sequences = st.text_area(
-            "Stop Sequences",
+    else:
+        st.warning("No API token found in .env file")
+        api_key = st.text_input(
+            "Hugging Face Token",
+            type="password",
             value="",
-            placeholder="Enter stop sequences separated by commas\ne.g., \\n\\n, ., !",
-            help="Comma-separated list of sequences where the model should stop generating."
+            help="Enter your Hugging Face API token"
         )
+        st.session_state.api_key = api_key
         
-        # Parse stop sequences
-        stop = None
-        if stop_sequences.strip():
-            stop = [seq.strip() for seq in stop_sequences.split(",") if seq.strip()]
-        
-        # Frequency Penalty
-        frequency_penalty = st.slider(
-            "Frequency Penalty",
-            min_value=-2.0,
-            max_value=2.0,
-            value=0.0,
-            step=0.1,
-            help="Penalizes repeated tokens. Positive values discourage repetition."
+    st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Response Options section
+    st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
+    st.subheader("Response Options")
+    
+    # Stream parameter
+    enable_streaming = st.checkbox("Enable Streaming", value=True, help="Stream responses in real-time or get complete response at once")
+    
+    # Show thinking parameter
+    show_thinking = st.checkbox("Show Thinking Process", value=True, help="Display model's thinking process separately from the response")
+    
+    # Response cache parameter
+    use_cache = st.checkbox("Cache Deterministic Responses", value=False, help="Reuse stored responses when a fixed seed or temperature 0 makes the output reproducible")
+    
+    # Comparison mode parameters
+    compare_mode = st.checkbox("Comparison Mode", value=False, help="Send each prompt to several parameter configurations at once and compare the responses side by side")
+    max_concurrency = 4
+    if compare_mode:
+        max_concurrency = st.number_input(
+            "Max Concurrent Runs",
+            min_value=1,
+            max_value=8,
+            value=4,
+            step=1,
+            help="How many comparison streams may run against the endpoint at the same time."
         )
-        
-        # Presence Penalty
-        presence_penalty = st.slider(
-            "Presence Penalty",
-            min_value=-2.0,
-            max_value=2.0,
-            value=0.0,
-            step=0.1,
-            help="Penalizes tokens that have appeared. Positive values encourage new topics."
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Model parameters section
+    st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
+    st.subheader("Model Parameters")
+    
+    # Temperature
+    temperature = st.slider(
+        "Temperature",
+        min_value=0.0,
+        max_value=2.0,
+        value=0.7,
+        step=0.1,
+        help="Controls randomness. Higher values make output more creative, lower values more focused."
+    )
+    
+    # Top P
+    top_p = st.slider(
+        "Top P",
+        min_value=0.0,
+        max_value=1.0,
+        value=0.9,
+        step=0.05,
+        help="Controls diversity via nucleus sampling. Lower values focus on most likely tokens."
+    )
+    
+    # Max Tokens
+    max_tokens = st.number_input(
+        "Max Tokens",
+        min_value=1,
+        max_value=1000,
+        value=150,
+        step=10,
+        help="Maximum number of tokens to generate in the response."
+    )
+    
+    # Seed
+    use_seed = st.checkbox("Use Fixed Seed", value=False)
+    seed = None
+    if use_seed:
+        seed = st.number_input(
+            "Seed",
+            min_value=0,
+            max_value=1000000,
+            value=42,
+            step=1,
+            help="Seed for reproducible outputs."
         )
-        st.markdown('</div>', unsafe_allow_html=True)
-        
-        # Clear chat button
-        if st.button("Clear Chat History", use_container_width=True):
-            st.session_state.messages = []
-            st.rerun()
+    
+    # Stop sequences
+    stop_sequences = st.text_area(
+        "Stop Sequences",
+        value="",
+        placeholder="Enter stop sequences separated by commas\ne.g., \\n\\n, ., !",
+        help="Comma-separated list of sequences where the model should stop generating."
+    )
+    
+    # Parse stop sequences
+    stop = None
+    if stop_sequences.strip():
+        stop = [seq.strip() for seq in stop_sequences.split(",") if seq.strip()]
+    
+    # Frequency Penalty
+    frequency_penalty = st.slider(
+        "Frequency Penalty",
+        min_value=-2.0,
+        max_value=2.0,
+        value=0.0,
+        step=0.1,
+        help="Penalizes repeated tokens. Positive values discourage repetition."
+    )
+    
+    # Presence Penalty
+    presence_penalty = st.slider(
+        "Presence Penalty",
+        min_value=-2.0,
+        max_value=2.0,
+        value=0.0,
+        step=0.1,
+        help="Penalizes tokens that have appeared. Positive values encourage new topics."
+    )
+    st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Context window section
+    st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
+    st.subheader("Context Window")
+    
+    context_limit = st.number_input(
+        "Context Limit (tokens)",
+        min_value=512,
+        max_value=131072,
+        value=CONTEXT_LIMIT,
+        step=512,
+        help="Model context size. Older turns are dropped so the request fits within this limit minus Max Tokens."
+    )
+    
+    context_strategy = st.selectbox(
+        "Overflow Strategy",
+        options=list(STRATEGIES.keys()),
+        index=0,
+        help="Which messages to keep when the conversation no longer fits."
+    )
+    st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Read by the chat page; a change that alters the page layout needs a full rerun
+    st.session_state.chat_params = {
+        "enable_streaming": enable_streaming,
+        "show_thinking": show_thinking,
+        "use_cache": use_cache,
+        "compare_mode": compare_mode,
+        "max_concurrency": max_concurrency,
+        "temperature": temperature,
+        "top_p": top_p,
+        "max_tokens": max_tokens,
+        "seed": seed,
+        "stop": stop,
+        "frequency_penalty": frequency_penalty,
+        "presence_penalty": presence_penalty,
+        "context_limit": context_limit,
+        "context_strategy": context_strategy,
+    }
+    layout = (show_thinking, compare_mode)
+    if st.session_state.get("chat_layout", layout) != layout:
+        st.session_state.chat_layout = layout
+        st.rerun()
+    st.session_state.chat_layout = layout
+    
+    # Circuit breaker state and latency of every endpoint (shared by all sessions in this process)
+    with st.expander("Endpoint Health", expanded=False):
+        breaker_icons = {"closed": "🟢", "half_open": "🟡", "open": "🔴"}
+        for endpoint in get_router().stats():
+            latency = f"{endpoint['latency']:.2f}s" if endpoint["latency"] is not None else "n/a"
+            st.write(f"{breaker_icons[endpoint['state']]} **{endpoint['name']}**: {endpoint['state'].replace('_', '-')}, "
+                     f"latency {latency}, {endpoint['in_flight']} in flight, "
+                     f"{endpoint['requests']} requests, {endpoint['failures']} failures")
+    
+    # Admin view of server memory held by chat sessions (ids are shortened: the full id opens the chat)
+    if ADMIN_VIEWS:
+        with st.expander("Session Memory", expanded=False):
+            # Measuring walks every loaded message in the process, so only do it on request
+            if st.toggle("Measure session memory", key="measure_memory"):
+                sessions = get_journals().memory()
+                resident = [s for s in sessions if s["resident"]]
+                st.write(f"• Total: {sum(s['bytes'] for s in sessions) / 1024:.0f} KB across {len(resident)} resident sessions "
+                         f"({len(sessions) - len(resident)} spilled to disk)")
+                st.dataframe(
+                    [
+                        {
+                            "Session": s["session"][:8] + (" (you)" if s["session"] == st.session_state.session_id else ""),
+                            "State": "resident" if s["resident"] else "spilled",
+                            "Messages": s["messages"],
+                            "KB": round(s["bytes"] / 1024, 1),
+                            "Idle (s)": round(s["idle"]),
+                            "Spills": s["spills"],
+                        }
+                        for s in sessions[:50]
+                    ],
+                    use_container_width=True,
+                    hide_index=True
+                )
+    
+    # Connection pool counters (shared by all sessions in this process)
+    with st.expander("Performance Stats", expanded=False):
+        pool_stats = get_client_pool().stats()
+        st.write(f"• Requests: {pool_stats['requests']}")
+        st.write(f"• Connections opened: {pool_stats['connections_opened']}")
+        st.write(f"• Connections reused: {pool_stats['connections_reused']}")
+        st.write(f"• Avg handshake: {pool_stats['avg_handshake_ms']:.0f} ms")
+        st.write(f"• Active clients: {pool_stats['active_clients']}")
+        if "context_stats" in st.session_state:
+            context_stats = st.session_state.context_stats
+            st.write(f"• Last request: {context_stats['sent_tokens']} tokens sent, "
+                     f"{context_stats['dropped_tokens']} dropped ({context_stats['dropped_messages']} messages)")
+        if use_cache:
+            cache_stats = get_response_cache().stats()
+            st.write(f"• Cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                     f"{cache_stats['entries']} entries ({cache_stats['total_bytes'] / 1024:.0f} KB)")
+        warmer = get_warmer()
+        if warmer and warmer.probes:
+            last_probe = warmer.probes[-1]
+            st.write(f"• Keep-warm: last probe ({last_probe['endpoint']}) {last_probe['state']} in {last_probe['latency']:.1f}s "
+                     f"({len(warmer.probes)} probes)")
+        flight_stats = get_single_flight().stats()
+        if flight_stats["joined"]:
+            st.write(f"• Coalesced: {flight_stats['joined']} requests joined {flight_stats['started']} upstream streams")
+        for label, savings in (("Session", st.session_state.savings), ("Process", get_process_savings())):
+            savings_summary = savings.summary()
+            if savings_summary["stopped"]:
+                st.write(f"• {label}: {savings_summary['stopped']} stopped early, "
+                         f"~{savings_summary['tokens_saved']} tokens and ~{savings_summary['seconds_saved']:.0f}s saved")
+        journal_stats = get_journals().stats()
+        st.write(f"• Sessions: {journal_stats['sessions']} in memory, {journal_stats['generating']} generating")
+        if HEDGING:
+            hedge_stats = get_hedger().stats()
+            st.write(f"• Hedging: {hedge_stats['hedged']} of {hedge_stats['requests']} requests hedged, "
+                     f"hedge answered first {hedge_stats['wins']} times ({hedge_stats['win_rate']:.0%})")
+        admission = get_admission()
+        if admission:
+            admission_stats = admission.stats()
+            st.write(f"• Endpoint slots: {admission_stats['active']}/{admission_stats['max_concurrency']} in use, "
+                     f"{admission_stats['waiting']} queued (avg wait {admission_stats['avg_wait']:.1f}s)")
+        display_metrics_summary("Session", st.session_state.metrics.summary())
+        display_metrics_summary("Process", get_process_metrics().summary())
+        if "render_stats" in st.session_state:
+            render_stats = st.session_state.render_stats
+            st.write(f"• Last stream: {render_stats['frames_rendered']} frames rendered, "
+                     f"{render_stats['frames_dropped']} coalesced, "
+                     f"{render_stats['chars_sent']:,} characters sent for {render_stats['chars']:,} streamed")
+    
+    # Clear chat button
+    if st.button("Clear Chat History", use_container_width=True):
+        journal = get_journals().get(st.session_state.session_id)
+        if journal.generation is not None:
+            journal.generation.cancel(discard=True)
+            journal.generation.reported = True
+        # Starts a new conversation; the old one stays in the store
+        journal.new_conversation()
+        st.rerun()
+
+def chat_page():
+    """Chat interface page"""
+    st.markdown('<div class="header">Trex1.6</div>', unsafe_allow_html=True)
+    # st.markdown('<div class="tagline">Advanced AI Chat with Customizable Parameters</div>', unsafe_allow_html=True)
+    # st.markdown('<div class="subtagline">Chat with trex1.6 model with full parameter control</div>', unsafe_allow_html=True)
+    
+    # The conversation is read from the store on first use, newest turns only; the list is
+    # shared with the background worker, which appends finished replies
+    journal = get_journals().get(st.session_state.session_id)
+    st.session_state.messages = journal.messages
+    # Rendered HTML of finalized messages keyed by (content hash, show_thinking); released when the session spills
+    st.session_state.html_cache = journal.html_cache
+
+   
+    # Sidebar for API configuration and parameters (a fragment of its own)
+    with st.sidebar:
+        chat_settings()
+    params = st.session_state.chat_params
+    enable_streaming, show_thinking, use_cache = params["enable_streaming"], params["show_thinking"], params["use_cache"]
+    compare_mode, max_concurrency = params["compare_mode"], params["max_concurrency"]
+    temperature, top_p, max_tokens, seed, stop = params["temperature"], params["top_p"], params["max_tokens"], params["seed"], params["stop"]
+    frequency_penalty, presence_penalty = params["frequency_penalty"], params["presence_penalty"]
+    context_limit, context_strategy = params["context_limit"], params["context_strategy"]
     
     # Main chat interface
     
-    # Display chat messages
-    if st.session_state.messages:
-        st.subheader("Chat Messages")
-        for message in st.session_state.messages:
-            display_chat_message(message["role"], message["content"], show_thinking)
-    else:
-        st.info("Start a conversation with trex1.6! Enter your message below.")
+    # Generation still running (or finished but not yet shown) in the background for this session
+    active = journal.generation if journal.generation is not None and not journal.generation.reported else None
+    
+    # Display chat messages; the reply drawn below the transcript is left out of it
+    st.session_state.shown_below = active.id if active is not None else None
+    chat_transcript(show_thinking)
+    
+    # Comparison configurations
+    if compare_mode:
+        st.subheader("Comparison Configurations")
+        st.caption("Each row runs with the sidebar's Max Tokens, Seed and Stop Sequences; blank cells fall back to the sidebar values. Results are not added to the chat history.")
+        compare_configs = st.data_editor(
+            DEFAULT_CONFIGS,
+            num_rows="dynamic",
+            use_container_width=True,
+            key="compare_configs"
+        )
+        compare_configs = [config for config in compare_configs if config.get("name")]
+        if "comparison" in st.session_state:
+            display_comparison_results(st.session_state.comparison, show_thinking)
     
     # Chat input
     if prompt := st.chat_input("Type your message here..."):
@@ -511,73 +785,156 @@ def chat_page():
             st.error("Please provide a Hugging Face API token. Check your .env file or enter it manually in the sidebar.")
             return
         
-        # Add user message to chat history
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        display_chat_message("user", prompt, show_thinking)
-        
         # Prepare API parameters
-        api_params = {
-            "temperature": temperature,
-            "top_p": top_p,
-            "max_tokens": max_tokens,
-            "frequency_penalty": frequency_penalty,
-            "presence_penalty": presence_penalty,
-        }
+        api_params = build_api_params(temperature, top_p, max_tokens, frequency_penalty, presence_penalty, seed, stop)
         
-        if seed is not None:
-            api_params["seed"] = seed
-        
-        if stop:
-            api_params["stop"] = stop
-        
-        # Create client and get response
-        client = create_openai_client(st.session_state.api_key)
+        # Comparison mode: run every config side by side instead of a single chat turn
+        if compare_mode:
+            if not compare_configs:
+                st.error("Add at least one named configuration to compare.")
+                return
+            user_message = make_message("user", prompt)
+            journal.ensure_context(context_limit - max_tokens)
+            compare_messages, st.session_state.context_stats = select_context(
+                st.session_state.messages + [user_message],
+                context_limit - max_tokens,
+                STRATEGIES[context_strategy]
+            )
+            st.session_state.comparison = run_comparison_view(prompt, compare_messages, compare_configs, api_params, max_concurrency, show_thinking)
+            st.rerun()
         
-        # Display assistant response
-        with st.container():
-            message_placeholder = st.empty()
+        if journal.generating:
+            st.warning("trex1.6 is still answering the previous message.")
+        else:
+            # Real traffic keeps the endpoint warm and feeds the traffic-based warm schedule
+            warmer = get_warmer()
+            if warmer:
+                warmer.record_request()
             
-            try:
+            # Add user message to chat history
+            user_message = make_message("user", prompt)
+            journal.append(user_message)
+            st.markdown(get_message_html(user_message, show_thinking), unsafe_allow_html=True)
+            
+            # Get pooled client and response
+            client = create_openai_client(st.session_state.api_key)
+            
+            # Keep the newest turns that fit the context budget (older ones are read from the store if needed)
+            journal.ensure_context(context_limit - max_tokens)
+            context_messages, st.session_state.context_stats = select_context(
+                st.session_state.messages,
+                context_limit - max_tokens,
+                STRATEGIES[context_strategy]
+            )
+            
+            # Look up deterministic requests in the response cache
+            cache_key = None
+            cached_text = None
+            if use_cache and is_deterministic(api_params):
+                cache_key = make_cache_key(MODEL, context_messages, api_params)
+                cached_text = get_response_cache().get(cache_key)
+            
+            # Everything the worker needs, captured here because it cannot touch st.session_state
+            session_id = st.session_state.session_id
+            session_metrics = st.session_state.metrics
+            session_savings = st.session_state.savings
+            sent_tokens = st.session_state.context_stats["sent_tokens"]
+            credential = hashlib.sha256(st.session_state.api_key.encode("utf-8")).hexdigest()
+            
+            def start_stream(on_retry, stream_timer, cancel):
+                """Open the upstream stream; may run on a coalescing or hedging thread"""
+                return get_response(client, context_messages, api_params, stream=True, on_retry=on_retry, timer=stream_timer, session=session_id, cancel=cancel)
+            
+            if HEDGING:
+                # Duplicate the request when its first token is unusually late
+                start_stream = get_hedger().wrap(start_stream)
+            
+            def generate(generation: Generation) -> Dict[str, Any]:
+                """Background worker: journal the reply's chunks and return the finished message"""
+                timer = RequestTimer()
                 if enable_streaming:
-                    # Streaming response
-                    full_response = ""
-                    
-                    # Show typing indicator
-                    with message_placeholder:
-                        st.markdown('<div class="default-container"><div style="color: #cccccc; font-style: italic;">trex1.6 is typing...</div></div>', unsafe_allow_html=True)
-                    
-                    # Stream the response
-                    for chunk in get_response(client, st.session_state.messages, api_params, stream=True):
-                        full_response += chunk
-                        
-                        # Update the display with accumulated response
-                        with message_placeholder:
-                            display_chat_message("assistant", full_response + "▌", show_thinking)
-                        
-                        # Small delay for better UX
-                        time.sleep(0.01)
-                    
-                    # Final display without cursor
-                    with message_placeholder:
-                        display_chat_message("assistant", full_response, show_thinking)
+                    parser = ThinkingStreamParser()
+                    if cached_text is not None:
+                        chunks = replay(cached_text)
+                    elif COALESCE and is_deterministic(api_params):
+                        # Identical deterministic requests from other sessions share one upstream stream,
+                        # but only sessions using the same API key, so nobody gets output their own key was not good for
+                        chunks = get_single_flight().stream(
+                            f"{credential}:{make_cache_key(MODEL, context_messages, api_params)}",
+                            start_stream,
+                            on_retry=generation.set_status,
+                            timer=timer
+                        )
+                    else:
+                        try:
+                            chunks = start_stream(generation.set_status, timer, generation.cancel_event)
+                        except InferenceError as e:
+                            # Stopped while queued or backing off: nothing was sent, so there is nothing to read
+                            if e.kind != CANCELLED:
+                                raise
+                            chunks = iter(())
+                    # Lets Stop close the upstream response while the loop is waiting on it
+                    generation.attach_stream(chunks)
+                    for chunk in chunks:
+                        if generation.cancelled:
+                            break
+                        generation.append(chunk)
+                        parser.feed(chunk)
+                        if parser.response_started:
+                            timer.mark_first_response()
+                    if generation.cancelled and hasattr(chunks, "close"):
+                        chunks.close()
+                    parser.close()
+                    full_response = generation.text
+                    assistant_message = make_message("assistant", full_response, *parser.result())
+                    if generation.cancelled:
+                        assistant_message["truncated"] = True
                 else:
-                    # Non-streaming response
-                    with message_placeholder:
-                        st.markdown('<div class="default-container"><div style="color: #cccccc; font-style: italic;">trex1.6 is generating response...</div></div>', unsafe_allow_html=True)
-                    
-                    full_response = get_response(client, st.session_state.messages, api_params, stream=False)
-                    
-                    with message_placeholder:
-                        display_chat_message("assistant", full_response, show_thinking)
+                    if cached_text is not None:
+                        full_response = cached_text
+                    else:
+                        try:
+                            full_response = get_response(client, context_messages, api_params, stream=False, on_retry=generation.set_status, timer=timer, session=session_id, cancel=generation.cancel_event)
+                        except InferenceError as e:
+                            if e.kind != CANCELLED:
+                                raise
+                            full_response = ""
+                    generation.append(full_response)
+                    assistant_message = make_message("assistant", full_response)
                 
-                # Add assistant response to chat history
-                st.session_state.messages.append({"role": "assistant", "content": full_response})
+                # Record request timings (cache replays do not reach the endpoint)
+                if cached_text is None:
+                    if not enable_streaming and parse_thinking_and_response(full_response)[1]:
+                        timer.mark_first_response()
+                    metrics = timer.finish(sent_tokens)
+                    assistant_message["metrics"] = metrics
+                    if generation.cancelled:
+                        # Estimate the rest of max_tokens at the rate this stream was generating
+                        metrics["tokens_saved"] = max(0, max_tokens - metrics["completion_tokens"])
+                        metrics["seconds_saved"] = metrics["tokens_saved"] / metrics["tokens_per_sec"] if metrics["tokens_per_sec"] else 0.0
+                        session_savings.add(metrics["tokens_saved"], metrics["seconds_saved"])
+                        get_process_savings().add(metrics["tokens_saved"], metrics["seconds_saved"])
+                    else:
+                        # Truncated requests would skew the latency percentiles
+                        session_metrics.add(metrics)
+                        get_process_metrics().add(metrics)
                 
-            except Exception as e:
-                error_msg = f"Error: {str(e)}"
-                with message_placeholder:
-                    display_chat_message("assistant", error_msg, show_thinking)
-                st.session_state.messages.append({"role": "assistant", "content": error_msg})
+                # Store fresh deterministic responses for replay
+                if cache_key and cached_text is None and not generation.cancelled:
+                    get_response_cache().put(cache_key, full_response)
+                return assistant_message
+            
+            # Keep any partial reply on failure, but never put the error text into the history sent with the next request
+            active = get_journals().start(journal, generate, lambda text: make_message("assistant", text), streaming=enable_streaming)
+    
+    # Display assistant response from the journal; survives reruns and browser refreshes
+    if active is not None:
+        st.session_state.shown_below = active.id
+        with st.container():
+            if active.done:
+                display_generation_result(active, show_thinking)
+            else:
+                follow_generation(show_thinking)
 
     # # Display current parameters in an expander
     # with st.expander("Current Parameters", expanded=False):
@@ -609,6 +966,11 @@ def main():
     """Main application function with page navigation"""
     initialize_session_state()
     
+    # Optional keep-warm probes; starts once per server process, and only with the server's own
+    # token so the process-wide thread never keeps spending a visitor's key
+    if os.getenv("HF_TOKEN"):
+        start_warmer(ENDPOINTS, os.getenv("HF_TOKEN"))
+    
     # Navigation in sidebar
     st.sidebar.title("Navigation")
     page = st.sidebar.selectbox(
@@ -621,6 +983,8 @@ def main():
     if page == "Chat Interface":
         chat_page()
     elif page == "Cost Calculator":
+        # Imported on first visit only
+        from cost_calculator import cost_calculator_page
         cost_calculator_page()
 
 if __name__ == "__main__":
@@ -0,0 +1,244 @@
+# Batch inference over a JSONL file of requests
+# Each input line is {"id": ..., "messages": [...]} or {"id": ..., "prompt": "..."} with optional
+# temperature, top_p, max_tokens, seed, stop, frequency_penalty and presence_penalty.
+# Lines that cannot be run (bad JSON, no prompt) get an error result with error_kind "invalid".
+# Usage: python batch.py prompts.jsonl --output results.jsonl --concurrency 8 --rps 4
+
+import os
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, Iterator, Tuple
+
+from dotenv import load_dotenv
+
+# Load environment variables before inference reads its settings
+load_dotenv()
+
+from inference import BASE_URL, create_openai_client, get_response, build_api_params
+from metrics import RequestTimer
+from retry import CANCELLED, InferenceError, classify_error
+
+DEFAULT_PARAMS = {"temperature": 0.7, "top_p": 0.9, "max_tokens": 150, "frequency_penalty": 0.0, "presence_penalty": 0.0}
+CHECKPOINT_EVERY = 2.0  # seconds between checkpoint writes
+INVALID = "invalid"  # error_kind of input lines that are not a runnable request
+
+
+class TokenBucket:
+    """Thread-safe token bucket: rate tokens per second, bursts up to capacity"""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0):
+        """Block until amount tokens are available, then take them"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait_time = (amount - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class Checkpoint:
+    """Track which input lines are finished so an interrupted run can resume
+
+    Stores a low-water mark (every line below it is done) plus the finished
+    lines above it. Lines complete out of order, but the set above the mark is
+    bounded by the concurrency, so the checkpoint stays small for any input size.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.next_line = 0
+        self.done_above = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.next_line = state["next_line"]
+            self.done_above = set(state["done_above"])
+
+    def is_done(self, line: int) -> bool:
+        """True if the line's result has already been written"""
+        return line < self.next_line or line in self.done_above
+
+    def mark_done(self, line: int):
+        """Record a finished line and advance the low-water mark"""
+        self.done_above.add(line)
+        while self.next_line in self.done_above:
+            self.done_above.remove(self.next_line)
+            self.next_line += 1
+
+    def save(self):
+        """Atomically write the checkpoint file"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"next_line": self.next_line, "done_above": sorted(self.done_above)}, f)
+        os.replace(tmp_path, self.path)
+
+
+def read_requests(path: str, checkpoint: Checkpoint) -> Iterator[Tuple[int, str]]:
+    """Stream (line number, raw line) pairs that are not finished yet; lines are parsed by run_record
+
+    Blank lines are yielded too, so the caller can mark them done and the
+    checkpoint's low-water mark moves past them.
+    """
+    with open(path) as f:
+        for line_number, line in enumerate(f):
+            if checkpoint.is_done(line_number):
+                continue
+            yield line_number, line
+
+
+def parse_record(line: str) -> Dict[str, Any]:
+    """Decode one input line; raises ValueError if it is not a JSON object"""
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("record is not a JSON object")
+    return record
+
+
+def request_messages(record: Dict[str, Any]) -> list:
+    """Chat messages for a record given either messages or a bare prompt"""
+    if "messages" in record:
+        return record["messages"]
+    if "prompt" in record:
+        return [{"role": "user", "content": record["prompt"]}]
+    raise ValueError("record has neither messages nor prompt")
+
+
+def error_result(line_number: int, record_id: Any, error: Exception, kind: str) -> Dict[str, Any]:
+    """Output record for a line that failed"""
+    return {"line": line_number, "id": record_id, "error": str(error), "error_kind": kind}
+
+
+def run_record(client, line_number: int, line: str, bucket: TokenBucket | None, stop: threading.Event | None = None) -> Dict[str, Any]:
+    """Run one request and return its output record; setting stop ends it early with a cancelled error"""
+    record_id = line_number
+    try:
+        record = parse_record(line)
+        record_id = record.get("id", line_number)
+        messages = request_messages(record)
+        params = {key: record.get(key, default) for key, default in DEFAULT_PARAMS.items()}
+        api_params = build_api_params(seed=record.get("seed"), stop=record.get("stop"), **params)
+    except (TypeError, ValueError) as e:
+        # Written as a result so the checkpoint moves past the line instead of stopping every resume
+        return error_result(line_number, record_id, e, INVALID)
+    result = {"line": line_number, "id": record_id}
+    if bucket:
+        bucket.acquire()
+    timer = RequestTimer()
+    try:
+        chunks = []
+        stream = get_response(client, messages, api_params, stream=True, timer=timer, session="batch", cancel=stop)
+        for chunk in stream:
+            if stop is not None and stop.is_set():
+                stream.close()
+                raise InferenceError(CANCELLED, "Interrupted")
+            chunks.append(chunk)
+        result["response"] = "".join(chunks)
+    except InferenceError as e:
+        result["error"] = str(e)
+        result["error_kind"] = e.kind
+    except Exception as e:
+        result["error"] = str(e)
+        result["error_kind"] = classify_error(e)
+    metrics = timer.finish()
+    result["latency"] = metrics["total"]
+    result["ttft"] = metrics["ttft"]
+    result["usage"] = {
+        "prompt_tokens": None if metrics["prompt_tokens_estimated"] else metrics["prompt_tokens"],
+        "completion_tokens": metrics["completion_tokens"],
+    }
+    return result
+
+
+def run_batch(input_path: str, output_path: str, concurrency: int, rps: float, api_key: str) -> Dict[str, int]:
+    """Run every unfinished request with at most concurrency in flight, appending results as they finish"""
+    checkpoint = Checkpoint(f"{output_path}.checkpoint")
+    bucket = TokenBucket(rps) if rps > 0 else None
+    client = create_openai_client(api_key)
+    counts = {"succeeded": 0, "failed": 0}
+    last_save = time.monotonic()
+    started = time.monotonic()
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    # Set on the way out so workers stop waiting, retrying and streaming instead of holding up exit
+    stop = threading.Event()
+    with open(output_path, "a") as output:
+        try:
+            in_flight = {}
+            records = read_requests(input_path, checkpoint)
+            exhausted = False
+            while in_flight or not exhausted:
+                # Keep the pool full without reading further ahead than the concurrency cap
+                while not exhausted and len(in_flight) < concurrency:
+                    try:
+                        line_number, line = next(records)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    if not line.strip():
+                        # Nothing to run or write, but the checkpoint must not stall below it
+                        checkpoint.mark_done(line_number)
+                        continue
+                    in_flight[executor.submit(run_record, client, line_number, line, bucket, stop)] = line_number
+                if not in_flight:
+                    break
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    line_number = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # One broken record must not stop the run (or every resume at the same line)
+                        result = error_result(line_number, line_number, e, classify_error(e))
+                    output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    counts["failed" if "error" in result else "succeeded"] += 1
+                    checkpoint.mark_done(line_number)
+                if time.monotonic() - last_save >= CHECKPOINT_EVERY:
+                    # Flush results before recording them as done
+                    output.flush()
+                    checkpoint.save()
+                    last_save = time.monotonic()
+                    done = counts["succeeded"] + counts["failed"]
+                    print(f"{done} done ({counts['failed']} failed), {done / (last_save - started):.2f} req/s", flush=True)
+        finally:
+            # Also runs on Ctrl+C: everything written so far is checkpointed, in-flight lines are redone on resume
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            output.flush()
+            checkpoint.save()
+    return counts
+
+
+def main():
+    """Parse arguments and run the batch"""
+    parser = argparse.ArgumentParser(description="Run a JSONL file of chat requests against the SmolLM3 endpoint")
+    parser.add_argument("input", nargs="?", default="requests.jsonl")
+    parser.add_argument("--output", default="results.jsonl", help="Results are appended here; <output>.checkpoint tracks progress")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum requests in flight")
+    parser.add_argument("--rps", type=float, default=0.0, help="Token-bucket request rate limit (0 = unlimited)")
+    args = parser.parse_args()
+
+    api_key = os.getenv("HF_TOKEN", "$HF_TOKEN")
+    print(f"Running {args.input} against {BASE_URL} -> {args.output}")
+    try:
+        counts = run_batch(args.input, args.output, args.concurrency, args.rps, api_key)
+        print(f"Finished: {counts['succeeded']} succeeded, {counts['failed']} failed")
+    except KeyboardInterrupt:
+        print("\nInterrupted; requests in flight were stopped. Run the same command again to resume.")
+
+
+if __name__ == "__main__":
+    main()
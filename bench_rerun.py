@@ -0,0 +1,132 @@
+# Measures how long a Streamlit script rerun of app.py takes and how much it sends to the browser
+# Usage:
+#   python bench_rerun.py --runs 30 --history 200
+#   python bench_rerun.py --page "Cost Calculator"
+
+import os
+import sys
+import time
+import uuid
+import argparse
+import tempfile
+from typing import Dict, Any, List
+
+from metrics import percentile
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+
+def seed_history(session: str, secret: str, count: int):
+    """Write count alternating user/assistant messages into the session's conversation, owned by secret"""
+    from conversation_store import get_conversation_store
+    store = get_conversation_store()
+    store.claim_session(session, secret)
+    conversation = store.new_conversation(session)
+    thinking = "Let me think about this step by step. " * 20
+    for index in range(count):
+        if index % 2 == 0:
+            store.append_message(conversation, {"role": "user", "content": f"Question {index}: explain topic {index} briefly."})
+        else:
+            response = f"Answer {index}. " + "Here is a short explanation. " * 15
+            store.append_message(conversation, {
+                "role": "assistant",
+                "content": f"<think>{thinking}</think>{response}",
+                "thinking": thinking,
+                "response": response,
+            })
+
+
+def payload_bytes(node) -> int:
+    """Serialized size of every element the run produced (what the websocket carries)"""
+    total = 0
+    proto = getattr(node, "proto", None)
+    if proto is not None and hasattr(proto, "ByteSize") and not getattr(node, "children", None):
+        total += proto.ByteSize()
+    for child in getattr(node, "children", {}).values():
+        total += payload_bytes(child)
+    return total
+
+
+def time_script_runs(timings: List[float]):
+    """Record how long each script execution takes inside the script thread
+
+    AppTest's own round trip adds a polling loop, so it is timed separately.
+    AppTest also recompiles the script on every run, which a server does once,
+    so compiled bytecode is shared across runs as it is in a server.
+    """
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.runtime.scriptrunner.script_runner import ScriptRunner
+    get_bytecode = ScriptCache.get_bytecode
+    compiled = {}
+    ScriptCache.get_bytecode = lambda self, path: compiled.get(path) or compiled.setdefault(path, get_bytecode(self, path))
+    run_script = ScriptRunner._run_script
+
+    def timed(self, rerun_data):
+        started = time.perf_counter()
+        try:
+            return run_script(self, rerun_data)
+        finally:
+            timings.append(time.perf_counter() - started)
+    ScriptRunner._run_script = timed
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    """Run the app once to warm up, then time args.runs reruns"""
+    from streamlit.testing.v1 import AppTest
+    script_timings: List[float] = []
+    time_script_runs(script_timings)
+    session = uuid.uuid4().hex
+    secret = uuid.uuid4().hex
+    if args.history:
+        seed_history(session, secret, args.history)
+
+    app = AppTest.from_file(APP_PATH, default_timeout=60)
+    app.query_params["session"] = session
+    # Stands in for the browser's secret cookie, which AppTest cannot send
+    app.session_state["session_secret"] = secret
+    started = time.perf_counter()
+    app.run()
+    first_run = time.perf_counter() - started
+    if args.page != "Chat Interface":
+        app.sidebar.selectbox[0].select(args.page)
+
+    timings: List[float] = []
+    del script_timings[:]
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        app.run()
+        timings.append(time.perf_counter() - started)
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+    return {
+        "first_run": first_run,
+        "timings": timings,
+        "script_timings": script_timings[-args.runs:],
+        "payload": payload_bytes(app._tree),
+    }
+
+
+def main():
+    """Parse arguments, run the benchmark and print a summary"""
+    parser = argparse.ArgumentParser(description="Time Streamlit reruns of app.py with AppTest")
+    parser.add_argument("--runs", type=int, default=30, help="Timed reruns after the first run")
+    parser.add_argument("--history", type=int, default=0, help="Messages to seed into the chat history")
+    parser.add_argument("--page", default="Chat Interface", choices=("Chat Interface", "Cost Calculator"))
+    args = parser.parse_args()
+
+    # Keep the benchmark's conversations out of the real store, and never call a real endpoint
+    os.environ["SMOLLM3_HISTORY_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench_rerun_"), "conversations.sqlite3")
+    os.environ.setdefault("HF_TOKEN", "benchmark")
+    sys.path.insert(0, os.path.dirname(APP_PATH))
+
+    result = run_benchmark(args)
+    print(f"{args.page}, {args.history} messages of history, {args.runs} reruns")
+    print(f"  First run:  {result['first_run'] * 1000:.0f} ms")
+    for label, timings in (("Script:", result["script_timings"]), ("Round trip:", result["timings"])):
+        print(f"  {label:<11} mean {sum(timings) / len(timings) * 1000:.1f} ms, "
+              f"p50 {percentile(timings, 50) * 1000:.1f} ms, p95 {percentile(timings, 95) * 1000:.1f} ms")
+    print(f"  Payload:    {result['payload'] / 1024:.1f} KB of elements per run")
+
+
+if __name__ == "__main__":
+    main()
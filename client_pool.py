@@ -0,0 +1,245 @@
+import os
+import time
+import hashlib
+import threading
+from typing import Dict, Any, Tuple
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+
+def _env_float(name: str, default: float) -> float:
+    """Read a float setting from the environment"""
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an int setting from the environment"""
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+# Pool limits and timeouts (overridable through .env)
+MAX_CONNECTIONS = _env_int("SMOLLM3_POOL_MAX_CONNECTIONS", 20)
+MAX_KEEPALIVE_CONNECTIONS = _env_int("SMOLLM3_POOL_MAX_KEEPALIVE", 10)
+KEEPALIVE_EXPIRY = _env_float("SMOLLM3_POOL_KEEPALIVE_EXPIRY", 60.0)
+CONNECT_TIMEOUT = _env_float("SMOLLM3_CONNECT_TIMEOUT", 10.0)
+READ_TIMEOUT = _env_float("SMOLLM3_READ_TIMEOUT", 120.0)
+CLIENT_IDLE_TTL = _env_float("SMOLLM3_CLIENT_IDLE_TTL", 600.0)
+
+HANDSHAKE_EVENTS = ("connection.connect_tcp", "connection.start_tls")
+
+
+class _PooledClient:
+    """An OpenAI client plus the connection counters of its HTTP pool"""
+
+    def __init__(self, base_url: str, api_key: str, limits: httpx.Limits, timeout: httpx.Timeout):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+        self.handshake_seconds = 0.0
+        self.last_used = time.monotonic()
+        # Requests still using the client (e.g. a long stream); it is never evicted while any are out
+        self.leases = 0
+        self.http_client = httpx.Client(
+            limits=limits,
+            timeout=timeout,
+            event_hooks={"request": [self._attach_trace]},
+        )
+        self.client = OpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            timeout=timeout,
+            # Retries are handled by retry.call_with_retry so cold starts get a longer deadline
+            max_retries=0,
+            http_client=self.http_client,
+        )
+
+    def _attach_trace(self, request: httpx.Request):
+        """Count the request and time any TCP/TLS handshake it triggers"""
+        started = {}
+
+        def trace(event_name: str, info: Dict[str, Any]):
+            name, _, phase = event_name.rpartition(".")
+            if name not in HANDSHAKE_EVENTS:
+                return
+            if phase == "started":
+                started[name] = time.perf_counter()
+            elif phase == "complete" and name in started:
+                elapsed = time.perf_counter() - started.pop(name)
+                with self.lock:
+                    self.handshake_seconds += elapsed
+                    if name == "connection.connect_tcp":
+                        self.connections_opened += 1
+
+        request.extensions["trace"] = trace
+        with self.lock:
+            self.requests += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of this client's connection counters"""
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "connections_reused": max(0, self.requests - self.connections_opened),
+                "handshake_seconds": self.handshake_seconds,
+                "idle_seconds": time.monotonic() - self.last_used,
+            }
+
+    def close(self):
+        """Close the underlying HTTP connection pool"""
+        self.http_client.close()
+
+
+class ClientLease:
+    """A pooled client handed out for one request; release() when the request is finished"""
+
+    def __init__(self, pool: "ClientPool", pooled: _PooledClient):
+        self.client = pooled.client
+        self._pool = pool
+        self._pooled = pooled
+        self._released = False
+
+    def release(self):
+        """Return the client to the pool (safe to call more than once)"""
+        if not self._released:
+            self._released = True
+            self._pool._release(self._pooled)
+
+
+class ClientPool:
+    """Process-wide registry of OpenAI clients keyed by (base_url, token hash)"""
+
+    def __init__(
+        self,
+        max_connections: int = MAX_CONNECTIONS,
+        max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = KEEPALIVE_EXPIRY,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        idle_ttl: float = CLIENT_IDLE_TTL,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._clients: Dict[Tuple[str, str], _PooledClient] = {}
+        self.clients_created = 0
+        self.clients_reused = 0
+        self.clients_evicted = 0
+        # Counters of evicted clients so totals never go backwards
+        self._retired = {"requests": 0, "connections_opened": 0, "handshake_seconds": 0.0}
+
+    @staticmethod
+    def _key(base_url: str, api_key: str) -> Tuple[str, str]:
+        """Registry key; tokens are hashed so they are never held as keys"""
+        return base_url, hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+    def _checkout(self, base_url: str, api_key: str) -> _PooledClient:
+        """Find or create the pooled client for this endpoint and token (called with the lock held)"""
+        key = self._key(base_url, api_key)
+        self._evict_idle()
+        pooled = self._clients.get(key)
+        if pooled is None:
+            pooled = _PooledClient(base_url, api_key, self.limits, self.timeout)
+            self._clients[key] = pooled
+            self.clients_created += 1
+        else:
+            self.clients_reused += 1
+        pooled.last_used = time.monotonic()
+        return pooled
+
+    def get(self, base_url: str, api_key: str) -> OpenAI:
+        """Return the shared client for this endpoint and token, creating it if needed
+
+        Use acquire() instead for requests that may outlast the idle TTL.
+        """
+        with self._lock:
+            return self._checkout(base_url, api_key).client
+
+    def acquire(self, base_url: str, api_key: str) -> ClientLease:
+        """Lease the shared client for one request; it is not evicted until the lease is released"""
+        with self._lock:
+            pooled = self._checkout(base_url, api_key)
+            pooled.leases += 1
+        return ClientLease(self, pooled)
+
+    def _release(self, pooled: _PooledClient):
+        with self._lock:
+            pooled.leases -= 1
+            pooled.last_used = time.monotonic()
+
+    def create_async_client(self, base_url: str, api_key: str) -> AsyncOpenAI:
+        """Create an AsyncOpenAI client with the pool's limits and timeouts
+
+        Async connections are bound to the event loop that opened them, so these
+        clients are not registered; the caller closes them when its loop ends.
+        """
+        return AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            timeout=self.timeout,
+            # Like the pooled clients: the SDK's own retries would bypass the router and retry policy
+            max_retries=0,
+            http_client=httpx.AsyncClient(limits=self.limits, timeout=self.timeout),
+        )
+
+    def _evict_idle(self):
+        """Close clients that have not been used for idle_ttl seconds and have no leases out"""
+        cutoff = time.monotonic() - self.idle_ttl
+        for key in [k for k, pooled in self._clients.items() if pooled.last_used < cutoff and pooled.leases == 0]:
+            pooled = self._clients.pop(key)
+            for name, value in pooled.stats().items():
+                if name in self._retired:
+                    self._retired[name] += value
+            pooled.close()
+            self.clients_evicted += 1
+
+    def evict_idle(self):
+        """Run idle eviction without requesting a client"""
+        with self._lock:
+            self._evict_idle()
+
+    def stats(self) -> Dict[str, Any]:
+        """Aggregate connection reuse and handshake counters across all clients"""
+        with self._lock:
+            totals = dict(self._retired)
+            for pooled in self._clients.values():
+                for name, value in pooled.stats().items():
+                    if name in totals:
+                        totals[name] += value
+            totals["connections_reused"] = max(0, totals["requests"] - totals["connections_opened"])
+            totals["avg_handshake_ms"] = (
+                totals["handshake_seconds"] / totals["connections_opened"] * 1000
+                if totals["connections_opened"] else 0.0
+            )
+            totals.update({
+                "active_clients": len(self._clients),
+                "clients_created": self.clients_created,
+                "clients_reused": self.clients_reused,
+                "clients_evicted": self.clients_evicted,
+            })
+            return totals
+
+    def close(self):
+        """Close every pooled client"""
+        with self._lock:
+            for pooled in self._clients.values():
+                pooled.close()
+            self._clients.clear()
+
+
+# Module-level singleton: Streamlit imports this module once per server process,
+# so every session and script thread shares the same pool.
+_pool = ClientPool()
+
+
+def get_client_pool() -> ClientPool:
+    """Return the process-wide client pool"""
+    return _pool
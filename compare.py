@@ -0,0 +1,132 @@
+import time
+import asyncio
+from typing import Callable, Dict, Any, List
+
+from openai import AsyncOpenAI
+
+from admission import get_admission
+from client_pool import get_client_pool
+from context_window import message_tokens
+from router import Router
+
+# Starting rows for the comparison table
+DEFAULT_CONFIGS = [
+    {"name": "Balanced", "temperature": 0.7, "top_p": 0.9, "frequency_penalty": 0.0, "presence_penalty": 0.0},
+    {"name": "Creative", "temperature": 1.0, "top_p": 0.95, "frequency_penalty": 0.2, "presence_penalty": 0.1},
+    {"name": "Focused", "temperature": 0.3, "top_p": 0.8, "frequency_penalty": 0.1, "presence_penalty": 0.0},
+]
+
+SAMPLING_KEYS = ("temperature", "top_p", "frequency_penalty", "presence_penalty")
+
+
+def config_params(config: Dict[str, Any], base_params: Dict[str, Any]) -> Dict[str, Any]:
+    """Overlay one comparison row's sampling values on the shared request params"""
+    params = dict(base_params)
+    for key in SAMPLING_KEYS:
+        if config.get(key) is not None:
+            params[key] = float(config[key])
+    return params
+
+
+async def _run_one(
+    router: Router,
+    client_for: Callable[[str], AsyncOpenAI],
+    messages: List[Dict[str, Any]],
+    params: Dict[str, Any],
+    index: int,
+    semaphore: asyncio.Semaphore,
+    on_chunk: Callable[[int, str], None],
+    session: str,
+) -> Dict[str, Any]:
+    """Stream one configuration on the endpoint the router picks, and time it"""
+    async with semaphore:
+        result = {"text": "", "ttft": None, "duration": 0.0, "tokens": 0, "tokens_per_sec": 0.0, "error": None}
+        parts = []
+        started = time.perf_counter()
+        admission = get_admission()
+        prompt_tokens = sum(message_tokens(m) for m in messages)
+        ticket = None
+        lease = None
+        error = None
+        try:
+            if admission:
+                # Every compared stream takes its own slot, under the same global cap as chat requests
+                ticket = await asyncio.to_thread(admission.acquire, session, prompt_tokens + params.get("max_tokens", 0))
+            # Routed like chat requests, so comparisons feed the latency weights and circuit breakers
+            lease = router.acquire()
+            stream = await client_for(lease.endpoint.base_url).chat.completions.create(
+                model=lease.endpoint.model,
+                messages=[{"role": m["role"], "content": m["content"]} for m in messages],
+                stream=True,
+                **params
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if result["ttft"] is None:
+                        result["ttft"] = time.perf_counter() - started
+                        lease.first_token()
+                    result["tokens"] += 1
+                    parts.append(chunk.choices[0].delta.content)
+                    on_chunk(index, chunk.choices[0].delta.content)
+        except Exception as e:
+            error = e
+            result["error"] = str(e)
+        finally:
+            if lease:
+                lease.finish(error)
+            if ticket:
+                await asyncio.to_thread(admission.release, ticket, prompt_tokens + result["tokens"])
+        result["text"] = "".join(parts)
+        result["duration"] = time.perf_counter() - started
+        generation_time = result["duration"] - (result["ttft"] or 0.0)
+        if result["tokens"] and generation_time > 0:
+            result["tokens_per_sec"] = result["tokens"] / generation_time
+        return result
+
+
+async def run_comparison(
+    router: Router,
+    api_key: str,
+    messages: List[Dict[str, Any]],
+    param_sets: List[Dict[str, Any]],
+    on_chunk: Callable[[int, str], None],
+    max_concurrency: int = 4,
+    session: str = "anonymous",
+    on_tick: Callable[[], None] | None = None,
+    tick_seconds: float = 0.05,
+) -> List[Dict[str, Any]]:
+    """Stream every param set concurrently, at most max_concurrency at a time
+
+    on_chunk(index, text) is called from the event loop as tokens arrive, so
+    the caller can update one output column per configuration. Each stream
+    waits for a slot from the cross-process admission controller, then goes
+    to the endpoint the router picks. Streams are not retried; a failure is
+    shown in its column and counts against the endpoint. on_tick is called
+    every tick_seconds while the streams run, e.g. to draw text held back by
+    a frame-rate limit when a stream stalls.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    # One async client per endpoint, bound to this event loop
+    clients: Dict[str, AsyncOpenAI] = {}
+
+    def client_for(base_url: str) -> AsyncOpenAI:
+        if base_url not in clients:
+            clients[base_url] = get_client_pool().create_async_client(base_url, api_key)
+        return clients[base_url]
+
+    async def tick():
+        while True:
+            await asyncio.sleep(tick_seconds)
+            on_tick()
+
+    ticker = asyncio.create_task(tick()) if on_tick else None
+    try:
+        return await asyncio.gather(*[
+            _run_one(router, client_for, messages, params, index, semaphore, on_chunk, session)
+            for index, params in enumerate(param_sets)
+        ])
+    finally:
+        if ticker:
+            ticker.cancel()
+        for client in clients.values():
+            await client.close()
@@ -0,0 +1,70 @@
+import os
+import re
+from typing import Dict, Any, List, Tuple
+
+# SmolLM3-3B context length (overridable through .env)
+CONTEXT_LIMIT = int(os.getenv("SMOLLM3_CONTEXT_TOKENS") or 65536)
+
+# Chat template tokens added around every message (role header, separators)
+MESSAGE_OVERHEAD = 4
+
+STRATEGIES = {
+    "Pin first system message": "pin_system",
+    "Truncate oldest": "truncate",
+}
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def count_tokens(text: str) -> int:
+    """Estimate the token count of text without a tokenizer
+
+    Words longer than four characters are usually split into several BPE
+    pieces, so each word counts as one token per four characters.
+    """
+    return sum((len(piece) + 3) // 4 for piece in _TOKEN_PATTERN.findall(text))
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    """Token count of a message, computed once and stored on the message"""
+    if "tokens" not in message:
+        message["tokens"] = count_tokens(message["content"]) + MESSAGE_OVERHEAD
+    return message["tokens"]
+
+
+def select_context(messages: List[Dict[str, Any]], budget: int, strategy: str = "pin_system") -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """Pick the newest messages that fit in budget tokens
+
+    Walks the history once from newest to oldest. The newest message is always
+    kept. With the pin_system strategy a leading system message is reserved
+    before anything else. Returns the selected messages in order and a report
+    of what was sent and dropped.
+    """
+    pinned = []
+    history = messages
+    if strategy == "pin_system" and messages and messages[0]["role"] == "system":
+        pinned = messages[:1]
+        history = messages[1:]
+
+    used = sum(message_tokens(m) for m in pinned)
+    start = len(history)
+    for index in range(len(history) - 1, -1, -1):
+        tokens = message_tokens(history[index])
+        if used + tokens > budget and index < len(history) - 1:
+            break
+        used += tokens
+        start = index
+
+    # Do not open the context with a reply whose prompt was dropped
+    if 0 < start < len(history) - 1 and history[start]["role"] == "assistant":
+        used -= message_tokens(history[start])
+        start += 1
+
+    selected = pinned + history[start:]
+    total = sum(message_tokens(m) for m in messages)
+    return selected, {
+        "sent_tokens": used,
+        "sent_messages": len(selected),
+        "dropped_tokens": total - used,
+        "dropped_messages": len(messages) - len(selected),
+    }
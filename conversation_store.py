@@ -0,0 +1,287 @@
+import os
+import hmac
+import json
+import time
+import uuid
+import zlib
+import hashlib
+import socket
+import sqlite3
+import threading
+from typing import Callable, Dict, Any, List, Tuple
+
+# Conversation database location (overridable through .env)
+HISTORY_PATH = os.getenv("SMOLLM3_HISTORY_PATH") or os.path.join(".cache", "conversations.sqlite3")
+# Message fields stored in their own columns; anything else (metrics, truncated) goes into extra as JSON
+MESSAGE_COLUMNS = ("role", "content", "hash", "thinking", "response", "tokens")
+# Text at least this long is zlib-compressed on disk (and, for thinking, in memory)
+COMPRESS_MIN_BYTES = 256
+# A draft whose writer has not appended to it for this long is treated as abandoned (overridable through .env)
+DRAFT_STALE_SECONDS = float(os.getenv("SMOLLM3_DRAFT_STALE_SECONDS") or 300)
+
+
+def compress_text(text: str) -> str | bytes:
+    """zlib-compress text worth compressing; short text is returned unchanged"""
+    data = text.encode("utf-8")
+    if len(data) < COMPRESS_MIN_BYTES:
+        return text
+    return zlib.compress(data)
+
+
+def decompress_text(value: str | bytes | None) -> str:
+    """Inverse of compress_text (plain strings pass through)"""
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode("utf-8")
+    return value or ""
+
+
+class ConversationStore:
+    """SQLite (WAL) store of conversations and their messages
+
+    Messages are append-only rows indexed by conversation, so a session can
+    load just its newest turns and page further back on demand. Long text is
+    stored compressed; thinking stays compressed when loaded. While a reply
+    streams, its text is appended to a draft in batches, tagged with the
+    writing process. A draft is only recovered as a truncated message once
+    its writer is gone: it is this process's own leftover, its process on
+    this host has exited, or nothing has been written to it for
+    DRAFT_STALE_SECONDS. Server processes can share the file.
+    """
+
+    def __init__(self, path: str = HISTORY_PATH):
+        self.path = path
+        # Identifies this process as the writer of its drafts
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL makes NORMAL durable across application crashes at a fraction of FULL's fsyncs
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                session TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS conversations_session ON conversations (session, created);
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                conversation TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                hash TEXT,
+                thinking TEXT,
+                response TEXT,
+                tokens INTEGER,
+                extra TEXT,
+                created REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS messages_conversation ON messages (conversation, id);
+            CREATE TABLE IF NOT EXISTS drafts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                conversation TEXT NOT NULL,
+                generation TEXT NOT NULL,
+                text TEXT NOT NULL,
+                owner TEXT,
+                written REAL
+            );
+            CREATE INDEX IF NOT EXISTS drafts_conversation ON drafts (conversation, id);
+            CREATE TABLE IF NOT EXISTS sessions (
+                session TEXT PRIMARY KEY,
+                secret TEXT NOT NULL
+            );
+        """)
+        # Drafts tables created before writers were recorded
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(drafts)")}
+        for column, kind in (("owner", "TEXT"), ("written", "REAL")):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE drafts ADD COLUMN {column} {kind}")
+        self._db.commit()
+
+    def claim_session(self, session: str, secret: str) -> bool:
+        """Whether secret owns the session; a session id seen for the first time is claimed by it
+
+        Only a hash of the secret is stored. A session that already has
+        history but no owner (e.g. from before owners were recorded) cannot
+        be claimed, since its id may have been shared.
+        """
+        digest = hashlib.sha256(secret.encode("utf-8")).hexdigest()
+        with self._lock:
+            row = self._db.execute("SELECT secret FROM sessions WHERE session = ?", (session,)).fetchone()
+            if row is None:
+                if self._db.execute("SELECT 1 FROM conversations WHERE session = ? LIMIT 1", (session,)).fetchone():
+                    return False
+                self._db.execute("INSERT OR IGNORE INTO sessions (session, secret) VALUES (?, ?)", (session, digest))
+                self._db.commit()
+                # Another process may have claimed it first
+                row = self._db.execute("SELECT secret FROM sessions WHERE session = ?", (session,)).fetchone()
+        return hmac.compare_digest(row[0], digest)
+
+    def new_conversation(self, session: str) -> str:
+        """Start a conversation for the session and return its id"""
+        conversation = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute("INSERT INTO conversations (id, session, created) VALUES (?, ?, ?)", (conversation, session, time.time()))
+            self._db.commit()
+        return conversation
+
+    def latest_conversation(self, session: str) -> str | None:
+        """The session's most recent conversation, if it has one"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id FROM conversations WHERE session = ? ORDER BY created DESC LIMIT 1", (session,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def append_message(self, conversation: str, message: Dict[str, Any]) -> int:
+        """Append a message and return its row id (also stored on the message as "id")"""
+        with self._lock:
+            message_id = self._insert_message(conversation, message)
+            self._db.commit()
+        return message_id
+
+    def _insert_message(self, conversation: str, message: Dict[str, Any]) -> int:
+        extra = {key: value for key, value in message.items() if key not in MESSAGE_COLUMNS and key != "id"}
+        cursor = self._db.execute(
+            "INSERT INTO messages (conversation, role, content, hash, thinking, response, tokens, extra, created) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (conversation, *(self._pack(column, message.get(column)) for column in MESSAGE_COLUMNS), json.dumps(extra) if extra else None, time.time())
+        )
+        message["id"] = cursor.lastrowid
+        return cursor.lastrowid
+
+    @staticmethod
+    def _pack(column: str, value: Any) -> Any:
+        if column in ("content", "thinking", "response") and isinstance(value, str):
+            return compress_text(value)
+        return value
+
+    def _message(self, row: Tuple) -> Dict[str, Any]:
+        message = {"id": row[0]}
+        message.update({column: value for column, value in zip(MESSAGE_COLUMNS, row[1:]) if value is not None})
+        # Thinking is only needed when a message is rendered, so it stays compressed
+        for column in ("content", "response"):
+            if column in message:
+                message[column] = decompress_text(message[column])
+        if row[-1]:
+            message.update(json.loads(row[-1]))
+        return message
+
+    def load_before(self, conversation: str, before_id: int | None = None, token_budget: int | None = None, limit: int | None = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """Newest messages older than before_id, in order, stopping once token_budget or limit is reached
+
+        Returns the messages and whether older ones remain.
+        """
+        query = "SELECT id, role, content, hash, thinking, response, tokens, extra FROM messages WHERE conversation = ?"
+        args = [conversation]
+        if before_id is not None:
+            query += " AND id < ?"
+            args.append(before_id)
+        query += " ORDER BY id DESC"
+        messages = []
+        tokens = 0
+        more = False
+        with self._lock:
+            cursor = self._db.execute(query, args)
+            for row in cursor:
+                if (limit is not None and len(messages) >= limit) or (token_budget is not None and tokens >= token_budget):
+                    more = True
+                    break
+                message = self._message(row)
+                tokens += message.get("tokens") or 0
+                messages.append(message)
+            cursor.close()
+        messages.reverse()
+        return messages, more
+
+    def append_draft(self, conversation: str, generation: str, text: str):
+        """Append a batch of streamed text for a reply that is still generating"""
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO drafts (conversation, generation, text, owner, written) VALUES (?, ?, ?, ?, ?)",
+                (conversation, generation, text, self.owner, time.time())
+            )
+            self._db.commit()
+
+    def discard_draft(self, generation: str):
+        """Drop a reply's draft once its final message is stored (or it was abandoned)"""
+        with self._lock:
+            self._db.execute("DELETE FROM drafts WHERE generation = ?", (generation,))
+            self._db.commit()
+
+    def _writer_gone(self, owner: str | None) -> bool:
+        """Whether the process that wrote a draft is known to have exited"""
+        if owner is None:
+            # Written before writers were recorded
+            return True
+        if owner == self.owner:
+            return True
+        host, _, rest = owner.partition(":")
+        pid = rest.partition(":")[0]
+        if host != socket.gethostname() or not pid.isdigit():
+            return False
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pass
+        return False
+
+    def recover_drafts(self, conversation: str, active: set, make_message: Callable[[str], Dict[str, Any]], stale_after: float = DRAFT_STALE_SECONDS) -> List[Dict[str, Any]]:
+        """Turn the conversation's abandoned drafts into messages made by make_message(text) and return them
+
+        A draft is abandoned when its generation is not in active and its
+        writer is gone (see _writer_gone) or last wrote to it more than
+        stale_after seconds ago. Claiming, storing the message and deleting
+        the draft happen in one write transaction, so two processes never
+        both recover the same draft.
+        """
+        recovered = []
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT generation, text, owner, written FROM drafts WHERE conversation = ? ORDER BY id", (conversation,)
+                ).fetchall()
+                drafts, owners, written = {}, {}, {}
+                for generation, text, owner, when in rows:
+                    drafts[generation] = drafts.get(generation, "") + text
+                    owners[generation] = owner
+                    written[generation] = max(written.get(generation, 0.0), when or 0.0)
+                cutoff = time.time() - stale_after
+                for generation, text in drafts.items():
+                    if generation in active or (written[generation] > cutoff and not self._writer_gone(owners[generation])):
+                        # Still being written, here or by another live process
+                        continue
+                    message = make_message(text)
+                    self._insert_message(conversation, message)
+                    self._db.execute("DELETE FROM drafts WHERE generation = ?", (generation,))
+                    recovered.append(message)
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return recovered
+
+    def stats(self) -> Dict[str, Any]:
+        """Row counts of the store"""
+        with self._lock:
+            conversations = self._db.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+            messages = self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        return {"conversations": conversations, "messages": messages}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """Return the process-wide conversation store, opening the database on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ConversationStore()
+        return _store
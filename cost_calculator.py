@@ -4,100 +4,8 @@ import math
 def cost_calculator_page():
     """Cost Calculator page for Hugging Face Inference Endpoints"""
     
-    # Apply same dark theme
-    st.markdown("""
-    <style>
-    html, body, .stApp {
-        background-color: #161616; 
-        height: 100%;
-        margin: 0;
-        padding: 0;
-    }
-    .stApp {
-        display: flex;
-        flex-direction: column;
-        min-height: 100vh;
-    }
-    .tagline {
-        font-size: 20px;
-        font-weight: bold;
-        color: #FFFFFF;
-        text-align: center;
-        margin-top: -10px;
-    }
-    .subtagline {
-        font-size: 14px;
-        color: #FFFFFF;
-        text-align: center;
-        padding:20px;
-        margin-bottom: 20px;
-    }
-     .header {
-        font-size: 39px;
-        font-weight: bold;
-        color: #FFFFFF;
-        text-align: center;
-        margin-top: -10px;
-        margin-bottom: 10px;
-    }
-    .sidebar-section {
-        padding: 1rem;
-        border-radius: 0.5rem;
-        margin-bottom: 1rem;
-        background: linear-gradient(105.13deg, #292929 41.52% 41.52% , rgba(63, 63, 63, 0) 100%);
-        backdrop-filter: blur(87.27272033691406px)
-    }
-    .metric-card {
-        background: linear-gradient(105.13deg, #1C1C1C 41.52%, rgba(63, 63, 63, 0) 100%) ;
-        color: white; 
-        border: 2px solid var(--light-dark-1004, #FFFFFF0A);
-        border-radius: 16px; 
-        padding: 12px; 
-      
-    }
-    .metric-card h3{
-        color: #ffffff90 !important;
-    }
-    .metric-card h2{
-        color: #FFFFFF !important;
-    }
-    .metric-card p{
-        color: #ffffff90 !important;
-    }
-    .cost-breakdown{
-        background: linear-gradient(105.13deg, #1C1C1C 41.52%, rgba(63, 63, 63, 0) 100%) !important;
-        color: white; 
-        border: 2px solid var(--light-dark-1004, #FFFFFF0A);
-        border-radius: 16px; 
-        padding: 12px; 
-        margin: 10px 0
-    }
-    .cost-breakdown h4 {
-        color: #FFFFFF !important;
-    }
-    .cost-breakdown span {
-        color: #FFFFFF !important;
-    }
-    .warning-box {
-        background-color: rgba(255, 193, 7, 0.1);
-        padding: 1rem;
-        border-radius: 0.5rem;
-        border: 1px solid rgba(255, 193, 7, 0.3);
-        margin: 1rem 0;
-        color: #ffc107;
-    }
-    .st-emotion-cache-11ofl8m{
-        background: linear-gradient(105.13deg, #1C1C1C 41.52%, rgba(63, 63, 63, 0) 100%) !important;
-    }
-    .st-emotion-cache-55l0h8{
-       background:black
-    }
-    .st-emotion-cache-1hiktyo:hover:enabled, .st-emotion-cache-1hiktyo:focus:enabled {
-        background: linear-gradient(105.13deg, #292929 41.52% 41.52% , rgba(63, 63, 63, 0) 100%) !important
-    }
-    
-    </style>
-    """, unsafe_allow_html=True)
+    # Page styles on top of the app theme; a static file the browser caches (static/cost_calculator.css)
+    st.html('<style>@import url("app/static/cost_calculator.css");</style>')
     
     # Header
     st.markdown('<div class="header">Endpoints Cost Calculator</div>', unsafe_allow_html=True)
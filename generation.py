@@ -0,0 +1,343 @@
+import os
+import sys
+import time
+import uuid
+import inspect
+import threading
+from typing import Callable, Dict, Any, List, Tuple
+
+from context_window import CONTEXT_LIMIT, message_tokens
+from conversation_store import ConversationStore, get_conversation_store
+
+# Sessions not seen for this long (and not generating) are dropped from memory; their history stays in the store (overridable through .env)
+SESSION_TTL = float(os.getenv("SMOLLM3_SESSION_TTL") or 3600)
+# Idle sessions release their in-memory history after this long; it is reloaded from the store on next access
+SPILL_AFTER = float(os.getenv("SMOLLM3_SPILL_AFTER") or 300)
+# How often an attached UI wakes up while waiting for the next chunk
+ATTACH_POLL_SECONDS = 0.5
+# A streaming reply's new text is committed to the store at most this often
+DRAFT_FLUSH_SECONDS = float(os.getenv("SMOLLM3_DRAFT_FLUSH_SECONDS") or 1.0)
+
+
+class Generation:
+    """One assistant reply produced by a background worker
+
+    The worker appends chunks to the journal; any number of script runs can
+    attach, replay the journal from the start and follow new chunks. Retry
+    and queue events are kept as the latest status for the UI to show.
+    """
+
+    def __init__(self, streaming: bool, on_flush: Callable[[str], None] | None = None):
+        self.id = uuid.uuid4().hex
+        self.streaming = streaming
+        self.chunks: List[str] = []
+        self.status = None
+        self.done = False
+        self.error = None
+        self.message = None
+        self.cancelled = False
+        # Set with cancelled, so a request still queued or backing off ends without being sent
+        self.cancel_event = threading.Event()
+        self.discarded = False
+        # Set once a script run has shown the finished reply or error
+        self.reported = False
+        self.stream = None
+        self.version = 0
+        self._cond = threading.Condition()
+        # Chunks not yet handed to on_flush, which persists them in batches
+        self._on_flush = on_flush
+        self._pending: List[str] = []
+        self._flushed_at = time.monotonic()
+
+    @property
+    def text(self) -> str:
+        """Everything generated so far"""
+        with self._cond:
+            return "".join(self.chunks)
+
+    def _changed(self):
+        self.version += 1
+        self._cond.notify_all()
+
+    def append(self, chunk: str):
+        """Journal a chunk, passing the text gathered since the last flush to on_flush every DRAFT_FLUSH_SECONDS"""
+        batch = None
+        with self._cond:
+            self.chunks.append(chunk)
+            self._changed()
+            if self._on_flush is not None:
+                self._pending.append(chunk)
+                now = time.monotonic()
+                if now - self._flushed_at >= DRAFT_FLUSH_SECONDS:
+                    batch = "".join(self._pending)
+                    self._pending = []
+                    self._flushed_at = now
+        if batch:
+            self._on_flush(batch)
+
+    def set_status(self, event: Dict[str, Any]):
+        """Record retry or queue progress (used as the request's on_retry)"""
+        with self._cond:
+            self.status = event
+            self._changed()
+
+    def finish(self, message: Dict[str, Any] | None, error: Exception | None = None):
+        """Mark the generation finished with its final message and error, if any"""
+        with self._cond:
+            self.message = message
+            self.error = error
+            self.done = True
+            self._changed()
+
+    def attach_stream(self, stream):
+        """Register the worker's chunk iterator so cancel() can close it"""
+        with self._cond:
+            self.stream = stream
+            cancelled = self.cancelled
+        if cancelled:
+            self._close(stream)
+
+    @staticmethod
+    def _close(stream):
+        # Plain generators cannot be closed from another thread; the worker notices cancelled instead
+        if hasattr(stream, "close") and not inspect.isgenerator(stream):
+            stream.close()
+
+    def cancel(self, discard: bool = False):
+        """Stop the worker and close the upstream response right away
+
+        A request that is still queued or backing off ends without being
+        sent. The partial reply is kept in the history unless discard is set
+        (e.g. when the chat is being cleared).
+        """
+        with self._cond:
+            self.cancelled = True
+            self.cancel_event.set()
+            self.discarded = self.discarded or discard
+            stream = self.stream
+            self._changed()
+        if stream is not None:
+            self._close(stream)
+
+    def wait(self, index: int, version: int, timeout: float = ATTACH_POLL_SECONDS) -> Tuple[List[str], Dict[str, Any] | None, bool, int]:
+        """Wait for anything newer than version; return chunks from index, status, done and the new version"""
+        with self._cond:
+            if self.version == version and not self.done:
+                self._cond.wait(timeout)
+            return self.chunks[index:], self.status, self.done, self.version
+
+
+def _size(value: Any) -> int:
+    """Approximate bytes held by a message or other nested container"""
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_size(k) + _size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def _truncated_message(text: str) -> Dict[str, Any]:
+    """Message for the recovered text of a reply that never finished"""
+    message = {"role": "assistant", "content": text, "truncated": True}
+    message_tokens(message)
+    return message
+
+
+class SessionJournal:
+    """State of one chat session that lives in the server process rather than in a script run
+
+    The conversation is read from the store on first use of messages, and
+    only its newest CONTEXT_LIMIT tokens are loaded; load_earlier() pages
+    further back. Every appended message is written to the store, so spill()
+    can drop the in-memory copy of an idle session at any time.
+    """
+
+    def __init__(self, session_id: str, store: ConversationStore):
+        self.session_id = session_id
+        self.store = store
+        self.conversation: str | None = None
+        self.has_earlier = False
+        self.generation: Generation | None = None
+        self.last_seen = time.monotonic()
+        self._messages: List[Dict[str, Any]] | None = None
+        # Rendered HTML of finalized messages keyed by (content hash, show_thinking)
+        self.html_cache: Dict[Tuple[str, bool], str] = {}
+        self.spills = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generating(self) -> bool:
+        return self.generation is not None and not self.generation.done
+
+    @property
+    def resident(self) -> bool:
+        """Whether the history is currently loaded in memory"""
+        return self._messages is not None
+
+    @property
+    def messages(self) -> List[Dict[str, Any]]:
+        """The loaded tail of the conversation, read from the store on first access"""
+        with self._lock:
+            if self._messages is None:
+                self._load()
+            return self._messages
+
+    def _load(self):
+        self.conversation = self.store.latest_conversation(self.session_id)
+        if self.conversation is None:
+            self.conversation = self.store.new_conversation(self.session_id)
+            self._messages, self.has_earlier = [], False
+            return
+        self._messages, self.has_earlier = self.store.load_before(self.conversation, token_budget=CONTEXT_LIMIT)
+        # Text streamed before its server process stopped is kept as a truncated reply
+        active = {self.generation.id} if self.generating else set()
+        self._messages.extend(self.store.recover_drafts(self.conversation, active, _truncated_message))
+
+    def append(self, message: Dict[str, Any]):
+        """Add a message to the history and the store"""
+        messages = self.messages
+        message_tokens(message)
+        with self._lock:
+            self.store.append_message(self.conversation, message)
+            messages.append(message)
+
+    def load_earlier(self, token_budget: int | None = None, limit: int | None = None) -> int:
+        """Prepend older messages from the store; returns how many were loaded"""
+        messages = self.messages
+        with self._lock:
+            if not self.has_earlier:
+                return 0
+            before = messages[0]["id"] if messages else None
+            earlier, self.has_earlier = self.store.load_before(self.conversation, before, token_budget, limit)
+            # In place, so lists handed out earlier (st.session_state.messages) stay current
+            messages[0:0] = earlier
+            return len(earlier)
+
+    def ensure_context(self, tokens: int):
+        """Load earlier messages until the loaded history holds at least tokens, e.g. for a larger context budget"""
+        loaded = sum(message_tokens(m) for m in self.messages)
+        while loaded < tokens and self.has_earlier:
+            count = self.load_earlier(token_budget=tokens - loaded)
+            loaded += sum(message_tokens(m) for m in self.messages[:count])
+
+    def new_conversation(self):
+        """Start an empty conversation; earlier ones stay in the store"""
+        messages = self.messages
+        with self._lock:
+            self.conversation = self.store.new_conversation(self.session_id)
+            self.has_earlier = False
+            messages.clear()
+            self.html_cache.clear()
+
+    def spill(self):
+        """Release the in-memory history and rendered HTML; the next access reloads them from the store"""
+        with self._lock:
+            if self._messages is None or self.generating:
+                return
+            # Cleared in place so copies held by idle script sessions are released too
+            self._messages.clear()
+            self._messages = None
+            self.html_cache.clear()
+            self.generation = None
+            self.spills += 1
+
+    def memory_bytes(self) -> int:
+        """Approximate bytes held by the loaded history, the rendered HTML and the last reply's chunks"""
+        with self._lock:
+            total = _size(self._messages or []) + _size(self.html_cache)
+            if self.generation is not None:
+                total += _size(self.generation.chunks)
+            return total
+
+
+class Journals:
+    """Process-wide registry of session journals and their background generations"""
+
+    def __init__(self, ttl: float = SESSION_TTL, spill_after: float = SPILL_AFTER, store: ConversationStore | None = None):
+        self.ttl = ttl
+        self.spill_after = spill_after
+        self.store = store
+        self._journals: Dict[str, SessionJournal] = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> SessionJournal:
+        """Return the session's journal, creating it on first use"""
+        now = time.monotonic()
+        with self._lock:
+            for stale_id in [sid for sid, j in self._journals.items() if now - j.last_seen > self.ttl and not j.generating]:
+                del self._journals[stale_id]
+            for idle in [j for j in self._journals.values() if now - j.last_seen > self.spill_after and j.resident and not j.generating]:
+                idle.spill()
+            journal = self._journals.get(session_id)
+            if journal is None:
+                journal = self._journals[session_id] = SessionJournal(session_id, self.store or get_conversation_store())
+            journal.last_seen = now
+            return journal
+
+    def start(
+        self,
+        journal: SessionJournal,
+        work: Callable[[Generation], Dict[str, Any]],
+        make_partial: Callable[[str], Dict[str, Any]],
+        streaming: bool = True,
+    ) -> Generation:
+        """Run work(generation) in a background thread; its returned message is appended to the journal
+
+        If work fails after producing text, make_partial(text) is kept in the
+        history instead and the error is recorded on the generation.
+        """
+        store = journal.store
+        conversation = journal.conversation
+        # Partial text reaches the store in batches so a restart mid-reply keeps it
+        generation = Generation(streaming, on_flush=lambda text: store.append_draft(conversation, generation.id, text))
+        journal.generation = generation
+
+        def run():
+            message, error = None, None
+            try:
+                message = work(generation)
+            except Exception as e:
+                error = e
+                text = generation.text
+                if text:
+                    message = make_partial(text)
+            # A discarded generation (the chat was cleared) must not reappear in the history
+            if message is not None and not generation.discarded:
+                journal.append(message)
+            store.discard_draft(generation.id)
+            generation.finish(message, error)
+
+        threading.Thread(target=run, name="smollm3-generation", daemon=True).start()
+        return generation
+
+    def stats(self) -> Dict[str, int]:
+        """Sessions held in memory and how many are generating"""
+        with self._lock:
+            journals = list(self._journals.values())
+        return {"sessions": len(journals), "generating": sum(j.generating for j in journals)}
+
+    def memory(self) -> List[Dict[str, Any]]:
+        """Memory footprint of every known session, largest first"""
+        with self._lock:
+            journals = list(self._journals.values())
+        now = time.monotonic()
+        sessions = [
+            {
+                "session": j.session_id,
+                "resident": j.resident,
+                "messages": len(j._messages or []),
+                "bytes": j.memory_bytes(),
+                "idle": now - j.last_seen,
+                "spills": j.spills,
+            }
+            for j in journals
+        ]
+        return sorted(sessions, key=lambda s: s["bytes"], reverse=True)
+
+
+_journals = Journals()
+
+
+def get_journals() -> Journals:
+    """Return the process-wide session journals"""
+    return _journals
@@ -0,0 +1,218 @@
+import os
+import time
+import queue
+import threading
+from collections import deque
+from typing import Callable, Dict, Any, Iterator, List
+
+from metrics import RequestTimer, percentile
+
+# Hedged requests are opt-in because every hedge is extra load on the endpoint (overridable through .env)
+HEDGING = os.getenv("SMOLLM3_HEDGE", "0") == "1"
+# Send the duplicate once the first token is later than this percentile of recent TTFTs
+HEDGE_PERCENTILE = float(os.getenv("SMOLLM3_HEDGE_PERCENTILE") or 95)
+# At most this fraction of requests may be hedged (at least one is always allowed)
+HEDGE_BUDGET = float(os.getenv("SMOLLM3_HEDGE_BUDGET") or 0.1)
+HEDGE_MIN_DELAY = float(os.getenv("SMOLLM3_HEDGE_MIN_DELAY") or 0.5)
+# Do not hedge until enough TTFTs have been seen to know what slow means
+HEDGE_MIN_SAMPLES = 10
+TTFT_WINDOW = 200
+
+# start_stream(on_retry, timer, cancel) opens the stream; cancel is set once nobody wants it any more
+StartStream = Callable[[Callable[[Dict[str, Any]], None], RequestTimer, threading.Event], Iterator[str]]
+
+
+class _Attempt:
+    """One copy of the request, pulled in its own thread into the shared event queue"""
+
+    def __init__(self, start_stream: StartStream, events: queue.Queue):
+        self.events = events
+        self.timer = RequestTimer()
+        self.stream = None
+        self.cancelled = False
+        self.cancel_event = threading.Event()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, args=(start_stream,), name="smollm3-hedge", daemon=True).start()
+
+    def _run(self, start_stream: StartStream):
+        try:
+            stream = start_stream(lambda event: self.events.put((self, "retry", event)), self.timer, self.cancel_event)
+            with self._lock:
+                self.stream = stream
+                cancelled = self.cancelled
+            if cancelled:
+                # Lost the race while still connecting
+                self._close(stream)
+                return
+            for chunk in stream:
+                if self.cancelled:
+                    return
+                self.events.put((self, "chunk", chunk))
+            self.events.put((self, "done", None))
+        except Exception as e:
+            self.events.put((self, "error", e))
+
+    @staticmethod
+    def _close(stream):
+        if hasattr(stream, "close"):
+            stream.close()
+
+    def cancel(self):
+        """Stop this attempt and close its upstream response if it has one"""
+        with self._lock:
+            self.cancelled = True
+            self.cancel_event.set()
+            stream = self.stream
+        if stream is not None:
+            self._close(stream)
+
+
+class HedgedStream:
+    """Iterator over the winning attempt's chunks; close() may be called from any thread"""
+
+    def __init__(self, hedger: "Hedger", start_stream: StartStream, on_retry: Callable[[Dict[str, Any]], None] | None, timer: RequestTimer | None):
+        self.events = queue.Queue()
+        self.attempts: List[_Attempt] = []
+        self.closed = False
+        self._chunks = hedger._stream(self, start_stream, on_retry, timer)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        return next(self._chunks)
+
+    def close(self):
+        """Cancel every attempt and end iteration"""
+        self.closed = True
+        for attempt in list(self.attempts):
+            attempt.cancel()
+        self.events.put((None, "closed", None))
+
+
+class Hedger:
+    """Send a duplicate request when the first token is late and keep whichever stream starts first
+
+    The hedge delay is HEDGE_PERCENTILE of recent times to first token, so
+    roughly the slowest few percent of requests are hedged. The duplicate
+    goes through the same path (admission, routing, retries) and so usually
+    lands on a less loaded endpoint. The losing attempt is cancelled as soon
+    as the winner's first token arrives. A budget caps hedges at HEDGE_BUDGET
+    of all requests.
+    """
+
+    def __init__(self, pct: float = HEDGE_PERCENTILE, budget: float = HEDGE_BUDGET, min_delay: float = HEDGE_MIN_DELAY):
+        self.pct = pct
+        self.budget = budget
+        self.min_delay = min_delay
+        self.ttfts = deque(maxlen=TTFT_WINDOW)
+        self.requests = 0
+        self.hedged = 0
+        self.wins = 0
+        self._lock = threading.Lock()
+
+    def hedge_delay(self) -> float | None:
+        """Seconds to wait for a first token before hedging, or None while there is too little history"""
+        with self._lock:
+            if len(self.ttfts) < HEDGE_MIN_SAMPLES:
+                return None
+            return max(self.min_delay, percentile(list(self.ttfts), self.pct))
+
+    def _take_budget(self) -> bool:
+        """Count a hedge if the budget allows one more"""
+        with self._lock:
+            if self.hedged >= max(1.0, self.budget * self.requests):
+                return False
+            self.hedged += 1
+            return True
+
+    def wrap(self, start_stream: StartStream) -> StartStream:
+        """Return a start_stream that hedges the given one
+
+        The HedgedStream is returned at once, so it is stopped through
+        close(), which sets the cancel event of each of its attempts.
+        """
+        return lambda on_retry, timer, cancel: HedgedStream(self, start_stream, on_retry, timer)
+
+    def _stream(self, handle: HedgedStream, start_stream: StartStream, on_retry: Callable[[Dict[str, Any]], None] | None, timer: RequestTimer | None) -> Iterator[str]:
+        """Yield the winning attempt's chunks; retry events and errors are relayed on the caller's thread"""
+        if handle.closed:
+            return
+        with self._lock:
+            self.requests += 1
+        started = time.perf_counter()
+        delay = self.hedge_delay()
+        hedge_at = started + delay if delay is not None else None
+        events = handle.events
+        attempts = handle.attempts
+        attempts.append(_Attempt(start_stream, events))
+        winner = None
+        failed = 0
+        try:
+            while not handle.closed:
+                timeout = None
+                if winner is None and hedge_at is not None:
+                    timeout = max(0.0, hedge_at - time.perf_counter())
+                try:
+                    attempt, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    hedge_at = None
+                    if self._take_budget():
+                        attempts.append(_Attempt(start_stream, events))
+                    continue
+                if kind == "closed":
+                    return
+                if winner is not None and attempt is not winner:
+                    continue
+
+                if kind == "retry":
+                    if on_retry and winner is None:
+                        on_retry(payload)
+                elif kind == "error":
+                    failed += 1
+                    # Fail only when no attempt is left that could still answer
+                    if winner is attempt or failed == len(attempts):
+                        raise payload
+                else:
+                    if winner is None:
+                        winner = attempt
+                        with self._lock:
+                            self.ttfts.append(time.perf_counter() - started)
+                            if attempt is not attempts[0]:
+                                self.wins += 1
+                        for other in attempts:
+                            if other is not winner:
+                                other.cancel()
+                        if timer:
+                            timer.connected = attempt.timer.connected
+                    if kind == "done":
+                        if timer:
+                            timer.set_usage(attempt.timer.usage)
+                        return
+                    if timer:
+                        timer.on_token()
+                    yield payload
+        finally:
+            # Also runs when the caller stops reading early
+            for attempt in attempts:
+                attempt.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """How many requests were hedged and how often the hedge answered first"""
+        delay = self.hedge_delay()
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedged": self.hedged,
+                "wins": self.wins,
+                "win_rate": self.wins / self.hedged if self.hedged else 0.0,
+                "delay": delay,
+            }
+
+
+_hedger = Hedger()
+
+
+def get_hedger() -> Hedger:
+    """Return the process-wide hedger"""
+    return _hedger
@@ -0,0 +1,205 @@
+import os
+import threading
+from typing import Generator, Dict, Any, Callable, List
+
+from openai import OpenAI
+
+from admission import get_admission
+from client_pool import get_client_pool
+from context_window import message_tokens
+from metrics import RequestTimer
+from retry import InferenceError, call_with_retry, classify_error
+from router import Lease, Router, parse_endpoints
+
+DEFAULT_BASE_URL = "https://av7tzsihe44dbvby.us-east-1.aws.endpoints.huggingface.cloud/v1/"
+# Point at another OpenAI-compatible server, e.g. the local mock_server.py
+BASE_URL = os.getenv("SMOLLM3_BASE_URL") or DEFAULT_BASE_URL
+MODEL = "HuggingFaceTB/SmolLM3-3B"
+# Endpoints to balance over as "name=url[|model]" entries, e.g.
+# "US East=https://a.example/v1/,EU West=https://b.example/v1/"; defaults to BASE_URL alone
+ENDPOINTS = parse_endpoints(os.getenv("SMOLLM3_ENDPOINTS") or (f"US East={BASE_URL}" if BASE_URL == DEFAULT_BASE_URL else BASE_URL), MODEL)
+# Ask for token usage in the final stream chunk (set to 0 for servers without stream_options)
+STREAM_USAGE = os.getenv("SMOLLM3_STREAM_USAGE", "1") != "0"
+
+
+def build_api_params(
+    temperature: float,
+    top_p: float,
+    max_tokens: int,
+    frequency_penalty: float = 0.0,
+    presence_penalty: float = 0.0,
+    seed: int | None = None,
+    stop: List[str] | None = None,
+) -> Dict[str, Any]:
+    """Build the sampling params sent with every chat completion"""
+    api_params = {
+        "temperature": temperature,
+        "top_p": top_p,
+        "max_tokens": max_tokens,
+        "frequency_penalty": frequency_penalty,
+        "presence_penalty": presence_penalty,
+    }
+    
+    if seed is not None:
+        api_params["seed"] = seed
+    
+    if stop:
+        api_params["stop"] = stop
+    
+    return api_params
+
+
+_router = Router(ENDPOINTS)
+
+
+def get_router() -> Router:
+    """Return the process-wide endpoint router"""
+    return _router
+
+
+def create_openai_client(api_key: str) -> OpenAI:
+    """Get the pooled OpenAI client for the custom base URL"""
+    return get_client_pool().get(BASE_URL, api_key)
+
+
+class ResponseStream:
+    """Iterator over the content deltas of a streaming chat completion
+
+    close() may be called from any thread: it closes the HTTP response, which
+    makes a blocked read return, and iteration then ends quietly. on_close is
+    called with the completion token count and the error, if any, once the
+    stream ends, fails, is closed or is abandoned. The lease is told when the
+    first token arrives.
+    """
+
+    def __init__(self, chat_completion, timer: RequestTimer | None = None, on_close: Callable[[int, Exception | None], None] | None = None, lease: Lease | None = None):
+        self.chat_completion = chat_completion
+        self.timer = timer
+        self.on_close = on_close
+        self.lease = lease
+        self.completion_tokens = 0
+        self.closed = False
+        self._started = False
+        self._finished = False
+        self._lock = threading.Lock()
+        self._chunks = self._read()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        return next(self._chunks)
+
+    def close(self):
+        """Stop the stream and release the connection"""
+        self.closed = True
+        self.chat_completion.close()
+        with self._lock:
+            started = self._started
+        if not started:
+            # Closed before anyone read from it, so _read() will never run its cleanup
+            self._finish(None)
+
+    def _finish(self, error: Exception | None):
+        """Call on_close exactly once"""
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+        if self.on_close:
+            self.on_close(self.completion_tokens, error)
+
+    def _read(self) -> Generator[str, None, None]:
+        with self._lock:
+            self._started = True
+        error = None
+        try:
+            for chunk in self.chat_completion:
+                if getattr(chunk, "usage", None):
+                    self.completion_tokens = chunk.usage.completion_tokens or self.completion_tokens
+                    if self.timer:
+                        self.timer.set_usage(chunk.usage)
+                if chunk.choices and hasattr(chunk.choices[0].delta, 'content') and chunk.choices[0].delta.content:
+                    self.completion_tokens += 1
+                    if self.lease:
+                        self.lease.first_token()
+                    if self.timer:
+                        self.timer.on_token()
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            if not self.closed:
+                error = InferenceError(classify_error(e), str(e))
+                raise error from e
+        finally:
+            self._finish(error)
+
+
+def get_response(client: OpenAI, messages: list, params: Dict[str, Any], stream: bool = True, on_retry: Callable[[Dict[str, Any]], None] | None = None, timer: RequestTimer | None = None, session: str = "anonymous", cancel: threading.Event | None = None) -> ResponseStream | str:
+    """Get response from the API, either streaming or non-streaming
+    
+    The request first waits for a slot from the cross-process admission
+    controller, reporting its queue position through on_retry. Each attempt
+    goes to an endpoint picked by the router, using the API key of client.
+    Cold starts, rate limits and timeouts are retried with backoff until the
+    first byte arrives; anything else raises InferenceError. Setting cancel
+    while the request is queued or backing off raises a CANCELLED
+    InferenceError straight away without sending it. When a timer is given
+    it records connect time, token timings and server-reported usage.
+    """
+    admission = get_admission()
+    prompt_tokens = sum(message_tokens(m) for m in messages)
+    ticket = admission.acquire(session, prompt_tokens + params.get("max_tokens", 0), on_wait=on_retry, cancel=cancel) if admission else None
+    
+    def release(completion_tokens: int | None):
+        if ticket:
+            admission.release(ticket, None if completion_tokens is None else prompt_tokens + completion_tokens)
+    
+    extra = {"stream_options": {"include_usage": True}} if stream and STREAM_USAGE else {}
+    lease = None
+    client_lease = None
+    
+    def attempt():
+        """Send the request to the endpoint the router picks for this attempt"""
+        nonlocal lease, client_lease
+        lease = get_router().acquire()
+        endpoint = lease.endpoint
+        # Leased so idle eviction cannot close the client under a long stream
+        client_lease = get_client_pool().acquire(endpoint.base_url, client.api_key)
+        try:
+            return client_lease.client.chat.completions.create(
+                model=endpoint.model,
+                messages=[{"role": m["role"], "content": m["content"]} for m in messages],
+                stream=stream,
+                **extra,
+                **params
+            )
+        except BaseException as e:
+            client_lease.release()
+            lease.finish(e)
+            raise
+    
+    try:
+        # Retry-After only speaks for the endpoint that sent it; with several, back off briefly and re-route
+        chat_completion = call_with_retry(attempt, on_retry=on_retry, honor_retry_after=len(get_router().endpoints) == 1, cancel=cancel)
+    except BaseException:
+        release(None)
+        raise
+    if timer:
+        timer.mark_connected()
+    
+    if stream:
+        def close(completion_tokens: int, error: Exception | None):
+            client_lease.release()
+            lease.finish(error)
+            release(completion_tokens)
+        
+        return ResponseStream(chat_completion, timer, on_close=close, lease=lease)
+    else:
+        client_lease.release()
+        lease.first_token()
+        lease.finish()
+        release(getattr(chat_completion.usage, "completion_tokens", None))
+        if timer:
+            timer.on_token()
+            timer.set_usage(chat_completion.usage)
+        return chat_completion.choices[0].message.content
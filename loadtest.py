@@ -0,0 +1,216 @@
+# Non-interactive asyncio load generator for the SmolLM3 endpoint
+# Usage:
+#   python loadtest.py --mode closed --users 1,2,4,8 --duration 30 --output results/run1
+#   python loadtest.py --mode open --rps 0.5,1,2 --duration 60 --no-stream --output results/run2
+
+import os
+import csv
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Dict, Any, List
+
+import httpx
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+
+from test import TEST_CONFIGS, BASE_URL
+from metrics import percentile
+from retry import classify_error
+
+# Load environment variables
+load_dotenv()
+
+
+def request_params(config: Dict[str, Any], stream: bool, include_usage: bool) -> Dict[str, Any]:
+    """Copy a test config's params with the requested streaming mode"""
+    params = dict(config["params"])
+    params["stream"] = stream
+    if stream and include_usage:
+        params["stream_options"] = {"include_usage": True}
+    return params
+
+
+async def timed_request(client: AsyncOpenAI, config: Dict[str, Any], stream: bool, include_usage: bool, started_at: float) -> Dict[str, Any]:
+    """Send one request and return its timing record"""
+    record = {
+        "config": config["name"], "stream": stream, "start": time.perf_counter() - started_at,
+        "ttft": None, "latency": None, "completion_tokens": 0, "error": None,
+    }
+    begin = time.perf_counter()
+    try:
+        response = await client.chat.completions.create(**request_params(config, stream, include_usage))
+        if stream:
+            chunks = 0
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if record["ttft"] is None:
+                        record["ttft"] = time.perf_counter() - begin
+                    chunks += 1
+                if getattr(chunk, "usage", None):
+                    record["completion_tokens"] = chunk.usage.completion_tokens
+            record["completion_tokens"] = record["completion_tokens"] or chunks
+        else:
+            record["ttft"] = time.perf_counter() - begin
+            if response.usage:
+                record["completion_tokens"] = response.usage.completion_tokens
+    except Exception as e:
+        record["error"] = classify_error(e)
+        record["error_message"] = str(e)[:200]
+    record["latency"] = time.perf_counter() - begin
+    return record
+
+
+async def run_closed_loop(client: AsyncOpenAI, users: int, duration: float, stream: bool, include_usage: bool) -> List[Dict[str, Any]]:
+    """N virtual users, each sending its next request as soon as the previous one finishes"""
+    records = []
+    started_at = time.perf_counter()
+    deadline = started_at + duration
+
+    async def user(index: int):
+        position = index
+        while time.perf_counter() < deadline:
+            config = TEST_CONFIGS[position % len(TEST_CONFIGS)]
+            position += 1
+            records.append(await timed_request(client, config, stream, include_usage, started_at))
+
+    await asyncio.gather(*[user(index) for index in range(users)])
+    return records
+
+
+async def run_open_loop(client: AsyncOpenAI, rps: float, duration: float, stream: bool, include_usage: bool, poisson: bool) -> List[Dict[str, Any]]:
+    """Send requests at a target arrival rate regardless of how fast they complete"""
+    tasks = []
+    started_at = time.perf_counter()
+    next_arrival = started_at
+    position = 0
+    while next_arrival < started_at + duration:
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        config = TEST_CONFIGS[position % len(TEST_CONFIGS)]
+        position += 1
+        tasks.append(asyncio.create_task(timed_request(client, config, stream, include_usage, started_at)))
+        next_arrival += random.expovariate(rps) if poisson else 1.0 / rps
+    return list(await asyncio.gather(*tasks))
+
+
+def summarize(records: List[Dict[str, Any]], wall_time: float) -> Dict[str, Any]:
+    """Latency percentiles, throughput and error rates for one load level"""
+    ok = [r for r in records if r["error"] is None]
+    summary = {
+        "requests": len(records),
+        "succeeded": len(ok),
+        "wall_time": wall_time,
+        "throughput_rps": len(ok) / wall_time if wall_time else 0.0,
+        "tokens_per_sec": sum(r["completion_tokens"] for r in ok) / wall_time if wall_time else 0.0,
+        "error_rate": (len(records) - len(ok)) / len(records) if records else 0.0,
+        "errors": {},
+    }
+    for record in records:
+        if record["error"]:
+            summary["errors"][record["error"]] = summary["errors"].get(record["error"], 0) + 1
+    for field in ("ttft", "latency"):
+        values = [r[field] for r in ok if r[field] is not None]
+        for pct in (50, 95, 99):
+            summary[f"{field}_p{pct}"] = percentile(values, pct) if values else None
+    per_request = [r["completion_tokens"] / (r["latency"] - r["ttft"]) for r in ok
+                   if r["ttft"] is not None and r["latency"] > r["ttft"] and r["completion_tokens"]]
+    summary["per_request_tokens_per_sec"] = sum(per_request) / len(per_request) if per_request else 0.0
+    return summary
+
+
+def write_results(output: str, run: Dict[str, Any]):
+    """Write the full run as JSON and one CSV row per load level"""
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(f"{output}.json", "w") as f:
+        json.dump(run, f, indent=2)
+    columns = [
+        "level", "requests", "succeeded", "throughput_rps", "tokens_per_sec", "error_rate",
+        "ttft_p50", "ttft_p95", "ttft_p99", "latency_p50", "latency_p95", "latency_p99",
+        "per_request_tokens_per_sec", "errors",
+    ]
+    with open(f"{output}.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        for level in run["levels"]:
+            writer.writerow(dict(level["summary"], level=level["level"], errors=json.dumps(level["summary"]["errors"])))
+
+
+def print_summary(mode: str, level: float, summary: Dict[str, Any]):
+    """One console line per load level"""
+    def fmt(value):
+        return f"{value:.2f}s" if value is not None else "n/a"
+
+    unit = "users" if mode == "closed" else "rps"
+    print(f"{level:>6g} {unit}: {summary['succeeded']}/{summary['requests']} ok, "
+          f"{summary['throughput_rps']:.2f} req/s, {summary['tokens_per_sec']:.1f} tok/s, "
+          f"TTFT p50/p95/p99 {fmt(summary['ttft_p50'])}/{fmt(summary['ttft_p95'])}/{fmt(summary['ttft_p99'])}, "
+          f"latency p50/p95/p99 {fmt(summary['latency_p50'])}/{fmt(summary['latency_p95'])}/{fmt(summary['latency_p99'])}, "
+          f"errors {summary['errors'] or 'none'}")
+
+
+async def run_load_test(args) -> Dict[str, Any]:
+    """Run every load level in turn; the levels together form the saturation curve"""
+    levels = [float(value) for value in (args.users if args.mode == "closed" else args.rps).split(",")]
+    stream = not args.no_stream
+    run = {
+        "base_url": args.base_url, "mode": args.mode, "stream": stream, "duration": args.duration,
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"), "levels": [],
+    }
+    for level in levels:
+        connections = int(level) if args.mode == "closed" else max(1, int(level * args.duration))
+        client = AsyncOpenAI(
+            base_url=args.base_url,
+            api_key=os.getenv("HF_TOKEN", "$HF_TOKEN"),
+            # Measure the endpoint as-is: failures are recorded, not retried
+            max_retries=0,
+            timeout=args.timeout,
+            http_client=httpx.AsyncClient(limits=httpx.Limits(max_connections=connections), timeout=args.timeout),
+        )
+        started = time.perf_counter()
+        if args.mode == "closed":
+            records = await run_closed_loop(client, int(level), args.duration, stream, args.usage)
+        else:
+            records = await run_open_loop(client, level, args.duration, stream, args.usage, args.poisson)
+        wall_time = time.perf_counter() - started
+        await client.close()
+        summary = summarize(records, wall_time)
+        print_summary(args.mode, level, summary)
+        entry = {"level": level, "summary": summary}
+        if args.raw:
+            entry["records"] = records
+        run["levels"].append(entry)
+    return run
+
+
+def main():
+    """Parse arguments, run the load test and write the results"""
+    parser = argparse.ArgumentParser(description="Load test the SmolLM3 endpoint with the test.py configs")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed",
+                        help="closed: N virtual users back to back; open: fixed arrival rate")
+    parser.add_argument("--users", default="1,2,4,8", help="Comma-separated virtual user counts (closed loop)")
+    parser.add_argument("--rps", default="0.5,1,2", help="Comma-separated target request rates (open loop)")
+    parser.add_argument("--poisson", action="store_true", help="Poisson instead of evenly spaced arrivals (open loop)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per load level")
+    parser.add_argument("--no-stream", action="store_true", help="Send non-streaming requests")
+    parser.add_argument("--usage", action="store_true", help="Ask for stream usage to count tokens exactly")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--raw", action="store_true", help="Include every request record in the JSON output")
+    parser.add_argument("--output", help="Write <output>.json and <output>.csv")
+    args = parser.parse_args()
+
+    print(f"Load testing {args.base_url} ({args.mode} loop, {'non-' if args.no_stream else ''}streaming)")
+    run = asyncio.run(run_load_test(args))
+    if args.output:
+        write_results(args.output, run)
+        print(f"Results written to {args.output}.json and {args.output}.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import math
+import time
+import threading
+from collections import deque
+from typing import Dict, Any, List
+
+# Inter-token latency histogram bucket upper bounds in milliseconds
+ITL_BUCKETS_MS = (5, 10, 20, 50, 100, 200, 500, 1000, float("inf"))
+RING_SIZE = 500
+PERCENTILES = (50, 95, 99)
+AGGREGATED_FIELDS = ("ttft", "ttft_response", "total", "tokens_per_sec")
+
+
+class RequestTimer:
+    """Collect the timings of one chat completion request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.connected = None
+        self.first_token = None
+        self.first_response_token = None
+        self.last_token = None
+        self.finished = None
+        self.chunks = 0
+        self.itl_histogram = [0] * len(ITL_BUCKETS_MS)
+        self.usage = None
+
+    def mark_connected(self):
+        """Response headers received (includes any retry waits)"""
+        self.connected = time.perf_counter()
+
+    def on_token(self):
+        """A content chunk arrived"""
+        now = time.perf_counter()
+        if self.first_token is None:
+            self.first_token = now
+        else:
+            gap_ms = (now - self.last_token) * 1000
+            for index, bound in enumerate(ITL_BUCKETS_MS):
+                if gap_ms <= bound:
+                    self.itl_histogram[index] += 1
+                    break
+        self.last_token = now
+        self.chunks += 1
+
+    def mark_first_response(self):
+        """First token outside a thinking block"""
+        if self.first_response_token is None:
+            self.first_response_token = time.perf_counter()
+
+    def set_usage(self, usage):
+        """Token usage reported by the server (stream_options include_usage or non-streaming)"""
+        if usage is not None:
+            self.usage = usage
+
+    def finish(self, prompt_tokens_estimate: int = 0) -> Dict[str, Any]:
+        """Stop the clock and return the request's metrics"""
+        self.finished = time.perf_counter()
+
+        def since_start(mark):
+            return mark - self.started if mark is not None else None
+
+        completion_tokens = getattr(self.usage, "completion_tokens", None) or self.chunks
+        prompt_tokens = getattr(self.usage, "prompt_tokens", None)
+        total = self.finished - self.started
+        generation_time = self.finished - (self.first_token or self.started)
+        return {
+            "connect": since_start(self.connected),
+            "ttft": since_start(self.first_token),
+            "ttft_response": since_start(self.first_response_token),
+            "total": total,
+            "tokens_per_sec": completion_tokens / generation_time if completion_tokens and generation_time > 0 else 0.0,
+            "prompt_tokens": prompt_tokens if prompt_tokens is not None else prompt_tokens_estimate,
+            "prompt_tokens_estimated": prompt_tokens is None,
+            "completion_tokens": completion_tokens,
+            "itl_histogram": dict(zip(histogram_labels(), self.itl_histogram)),
+        }
+
+
+def histogram_labels() -> List[str]:
+    """Human readable labels for the inter-token latency buckets"""
+    labels = []
+    lower = 0
+    for bound in ITL_BUCKETS_MS:
+        labels.append(f">{lower}ms" if bound == float("inf") else f"{lower}-{bound}ms")
+        lower = bound
+    return labels
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of values"""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class MetricsRing:
+    """Bounded in-memory buffer of request metrics with percentile aggregates"""
+
+    def __init__(self, size: int = RING_SIZE):
+        self.records = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict[str, Any]):
+        """Append one request's metrics, dropping the oldest when full"""
+        with self._lock:
+            self.records.append(record)
+
+    def summary(self) -> Dict[str, Any]:
+        """p50/p95/p99 of every aggregated field over the buffered requests"""
+        with self._lock:
+            records = list(self.records)
+        summary = {}
+        for field in AGGREGATED_FIELDS:
+            values = [r[field] for r in records if r.get(field) is not None]
+            if values:
+                summary[field] = {f"p{p}": percentile(values, p) for p in PERCENTILES}
+        summary["count"] = len(records)
+        return summary
+
+
+class SavingsCounter:
+    """Running totals of generations stopped early and the tokens and time that saved"""
+
+    def __init__(self):
+        self.stopped = 0
+        self.tokens_saved = 0
+        self.seconds_saved = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, tokens_saved: int, seconds_saved: float):
+        """Count one stopped generation"""
+        with self._lock:
+            self.stopped += 1
+            self.tokens_saved += tokens_saved
+            self.seconds_saved += seconds_saved
+
+    def summary(self) -> Dict[str, Any]:
+        """Totals so far"""
+        with self._lock:
+            return {"stopped": self.stopped, "tokens_saved": self.tokens_saved, "seconds_saved": self.seconds_saved}
+
+
+# Shared by every session in this server process
+_process_metrics = MetricsRing()
+_process_savings = SavingsCounter()
+
+
+def get_process_metrics() -> MetricsRing:
+    """Return the process-wide metrics ring buffer"""
+    return _process_metrics
+
+
+def get_process_savings() -> SavingsCounter:
+    """Return the process-wide counter of generations stopped early"""
+    return _process_savings
@@ -0,0 +1,255 @@
+# Local OpenAI-compatible mock of the SmolLM3 endpoint for offline benchmarking
+# Usage: python mock_server.py --profile realistic --port 8808
+#        SMOLLM3_BASE_URL=http://127.0.0.1:8808/v1/ streamlit run app.py
+
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List
+
+# Latency / failure profiles; every field can be overridden on the command line
+PROFILES = {
+    "fast": {
+        "ttft": 0.05, "tokens_per_sec": 200.0, "cold_start": 0.0, "idle_timeout": 0.0,
+        "error_rate": 0.0, "burst_length": 0, "think": True,
+    },
+    "realistic": {
+        "ttft": 0.4, "tokens_per_sec": 45.0, "cold_start": 0.0, "idle_timeout": 0.0,
+        "error_rate": 0.0, "burst_length": 0, "think": True,
+    },
+    "cold": {
+        "ttft": 0.4, "tokens_per_sec": 45.0, "cold_start": 20.0, "idle_timeout": 60.0,
+        "error_rate": 0.0, "burst_length": 0, "think": True,
+    },
+    "flaky": {
+        "ttft": 0.6, "tokens_per_sec": 30.0, "cold_start": 0.0, "idle_timeout": 0.0,
+        "error_rate": 0.05, "burst_length": 5, "think": True,
+    },
+}
+
+WORDS = (
+    "the model learns patterns from data and uses them to make predictions about new inputs "
+    "neural networks stack layers of simple functions so that deep learning can represent "
+    "complex relationships training adjusts weights to reduce error on examples while "
+    "evaluation checks how well it generalizes"
+).split()
+
+
+class MockState:
+    """Shared cold-start and error-burst state of the mock endpoint"""
+
+    def __init__(self, profile: Dict[str, Any]):
+        self.profile = profile
+        self.lock = threading.Lock()
+        self.last_request = None
+        self.warm_at = 0.0 if not profile["cold_start"] else time.monotonic() + profile["cold_start"]
+        self.burst_remaining = 0
+        self.burst_status = 503
+        self.requests = 0
+
+    def admit(self) -> tuple[int, float] | None:
+        """Return (status, retry_after) if this request should fail, else None"""
+        now = time.monotonic()
+        with self.lock:
+            self.requests += 1
+            idle_timeout = self.profile["idle_timeout"]
+            if idle_timeout and self.last_request is not None and now - self.last_request > idle_timeout:
+                # Scaled to zero while idle: the next requests wake a replica
+                self.warm_at = now + self.profile["cold_start"]
+            self.last_request = now
+            if now < self.warm_at:
+                return 503, max(1.0, self.warm_at - now)
+            if self.burst_remaining:
+                self.burst_remaining -= 1
+                return self.burst_status, 1.0
+            if self.profile["error_rate"] and random.random() < self.profile["error_rate"]:
+                self.burst_status = random.choice((429, 503))
+                self.burst_remaining = max(0, self.profile["burst_length"] - 1)
+                return self.burst_status, 1.0
+        return None
+
+
+def generate_text(body: Dict[str, Any], think: bool) -> List[str]:
+    """Deterministic pseudo-answer for the request, as a list of token strings"""
+    messages = body.get("messages") or [{"content": ""}]
+    seed = body.get("seed")
+    rng = random.Random(seed if seed is not None else messages[-1].get("content", ""))
+    max_tokens = int(body.get("max_tokens") or 150)
+    tokens = []
+    if think:
+        tokens.append("<think>")
+        tokens.extend(" " + rng.choice(WORDS) for _ in range(min(20, max_tokens // 3)))
+        tokens.append("</think>\n\n")
+    while len(tokens) < max_tokens:
+        tokens.append((" " if tokens and not tokens[-1].endswith("\n") else "") + rng.choice(WORDS))
+        if rng.random() < 0.08:
+            tokens.append(".\n\n" if rng.random() < 0.3 else ".")
+    tokens = tokens[:max_tokens]
+
+    stop = body.get("stop")
+    if stop:
+        stops = [stop] if isinstance(stop, str) else stop
+        text = ""
+        for index, token in enumerate(tokens):
+            text += token
+            hits = [text.find(s) for s in stops if s and s in text]
+            if hits:
+                # Cut the last token so the output ends right before the stop sequence
+                cut = min(hits) - (len(text) - len(token))
+                return tokens[:index] + ([token[:cut]] if cut > 0 else [])
+    return tokens
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible /v1/chat/completions with simulated latency"""
+
+    protocol_version = "HTTP/1.1"
+    state: MockState = None
+    quiet = False
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Dict[str, str] | None = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/health", "/v1/health"):
+            self._send_json(200, {"status": "ok"})
+        elif self.path.rstrip("/") == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [{"id": "HuggingFaceTB/SmolLM3-3B", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        failure = self.state.admit()
+        if failure:
+            status, retry_after = failure
+            message = "Service Unavailable: endpoint is initializing" if status == 503 else "Rate limit reached"
+            self._send_json(status, {"error": {"message": message}}, {"Retry-After": f"{retry_after:.0f}"})
+            return
+
+        profile = self.state.profile
+        tokens = generate_text(body, profile["think"])
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = body.get("model", "HuggingFaceTB/SmolLM3-3B")
+        usage = {
+            "prompt_tokens": sum(len(str(m.get("content", "")).split()) for m in body.get("messages", [])),
+            "completion_tokens": len(tokens),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        finish_reason = "stop" if len(tokens) < int(body.get("max_tokens") or 150) else "length"
+        interval = 1.0 / profile["tokens_per_sec"] if profile["tokens_per_sec"] > 0 else 0.0
+
+        time.sleep(profile["ttft"])
+        if not body.get("stream"):
+            time.sleep(interval * len(tokens))
+            self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                             "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for index, token in enumerate(tokens):
+                if index:
+                    time.sleep(interval)
+                chunk = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                }
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            final = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}],
+            }
+            self._write_chunk(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                usage_chunk = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [], "usage": usage,
+                }
+                self._write_chunk(f"data: {json.dumps(usage_chunk)}\n\n".encode("utf-8"))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client cancelled the stream
+            self.close_connection = True
+
+
+def start_mock_server(profile: str | Dict[str, Any] = "fast", host: str = "127.0.0.1", port: int = 0, quiet: bool = True) -> ThreadingHTTPServer:
+    """Start the mock in a background thread and return the server; its base URL is server.base_url"""
+    settings = dict(PROFILES[profile]) if isinstance(profile, str) else dict(profile)
+    handler = type("Handler", (MockHandler,), {"state": MockState(settings), "quiet": quiet})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.base_url = f"http://{host}:{server.server_port}/v1/"
+    threading.Thread(target=server.serve_forever, name="smollm3-mock", daemon=True).start()
+    return server
+
+
+def main():
+    """Run the mock server in the foreground"""
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock of the SmolLM3 endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="realistic")
+    parser.add_argument("--ttft", type=float, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, help="Generation speed")
+    parser.add_argument("--cold-start", type=float, help="Seconds of 503s while a replica starts")
+    parser.add_argument("--idle-timeout", type=float, help="Idle seconds before scaling to zero (0 = never)")
+    parser.add_argument("--error-rate", type=float, help="Probability that a request starts a 429/503 burst")
+    parser.add_argument("--burst-length", type=int, help="Requests failed per burst")
+    parser.add_argument("--no-think", action="store_true", help="Do not emit <think> blocks")
+    parser.add_argument("--quiet", action="store_true", help="Do not log requests")
+    args = parser.parse_args()
+
+    profile = dict(PROFILES[args.profile])
+    for key in ("ttft", "tokens_per_sec", "cold_start", "idle_timeout", "error_rate", "burst_length"):
+        if getattr(args, key) is not None:
+            profile[key] = getattr(args, key)
+    if args.no_think:
+        profile["think"] = False
+
+    handler = type("Handler", (MockHandler,), {"state": MockState(profile), "quiet": args.quiet})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    print(f"Mock SmolLM3 endpoint on http://{args.host}:{args.port}/v1/ ({args.profile}: {profile})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import os
+import time
+from typing import Callable, Dict, Any
+
+# Streaming render limits (overridable through .env)
+MAX_FPS = float(os.getenv("SMOLLM3_RENDER_MAX_FPS") or 20)
+FLUSH_BYTES = int(os.getenv("SMOLLM3_RENDER_FLUSH_BYTES") or 2048)
+
+
+class RenderScheduler:
+    """Coalesce streamed chunks into at most max_fps renders per second
+
+    render is called with final=False for intermediate frames and exactly once
+    with final=True from finish(). A frame is flushed early when max_bytes of
+    new text have been buffered since the last render. Chunks held back by the
+    frame interval are only drawn by a later push() unless the caller also
+    calls tick() periodically, so a stalled stream still shows them.
+    """
+
+    def __init__(
+        self,
+        render: Callable[[bool], None],
+        max_fps: float = MAX_FPS,
+        max_bytes: int = FLUSH_BYTES,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.render = render
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.pending_bytes = 0
+        self.last_render = None
+        self.chunks = 0
+        self.frames_rendered = 0
+        self.frames_dropped = 0
+
+    def push(self, chunk: str):
+        """Buffer a chunk and render if the frame interval or byte threshold is reached"""
+        self.chunks += 1
+        self.pending_bytes += len(chunk.encode("utf-8"))
+        now = self.clock()
+        due = self.last_render is None or now - self.last_render >= self.min_interval
+        if due or self.pending_bytes >= self.max_bytes:
+            self._flush(now, final=False)
+        else:
+            self.frames_dropped += 1
+
+    def tick(self):
+        """Render buffered text once its frame is due, without a new chunk arriving"""
+        now = self.clock()
+        if self.pending_bytes and now - self.last_render >= self.min_interval:
+            self._flush(now, final=False)
+
+    def finish(self):
+        """Render the final frame; always called once at stream end"""
+        self._flush(self.clock(), final=True)
+
+    def _flush(self, now: float, final: bool):
+        """Render buffered text and reset the frame window"""
+        self.render(final)
+        self.frames_rendered += 1
+        self.pending_bytes = 0
+        self.last_render = now
+
+    def stats(self) -> Dict[str, Any]:
+        """Rendered versus dropped (coalesced) frame counts"""
+        return {
+            "chunks": self.chunks,
+            "frames_rendered": self.frames_rendered,
+            "frames_dropped": self.frames_dropped,
+        }
@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Any, Iterator, List
+
+# Cache location and limits (overridable through .env)
+CACHE_PATH = os.getenv("SMOLLM3_CACHE_PATH") or os.path.join(".cache", "responses.sqlite3")
+CACHE_MAX_BYTES = int(os.getenv("SMOLLM3_CACHE_MAX_BYTES") or 50 * 1024 * 1024)
+CACHE_TTL = float(os.getenv("SMOLLM3_CACHE_TTL") or 7 * 24 * 3600)
+# Replay pace for cache hits; 0 replays as fast as the UI can render
+REPLAY_CHARS_PER_SECOND = float(os.getenv("SMOLLM3_CACHE_REPLAY_CPS") or 2000)
+REPLAY_CHUNK_CHARS = 16
+
+
+def is_deterministic(params: Dict[str, Any]) -> bool:
+    """True when the sampling params should reproduce the same output"""
+    return params.get("seed") is not None or params.get("temperature") == 0
+
+
+def make_cache_key(model: str, messages: List[Dict[str, Any]], params: Dict[str, Any]) -> str:
+    """Canonical hash of the model, message roles/contents and sampling params"""
+    payload = {
+        "model": model,
+        "messages": [{"role": m["role"], "content": m["content"]} for m in messages],
+        "params": params,
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed response cache with TTL expiry and LRU eviction under a byte cap"""
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES, ttl: float = CACHE_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.bytes_served = 0
+        self.bytes_stored = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                bytes INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._db.commit()
+
+    def get(self, key: str) -> str | None:
+        """Return the cached text for key, or None on a miss or expired entry"""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT text, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+            self.bytes_served += len(row[0].encode("utf-8"))
+            return row[0]
+
+    def put(self, key: str, text: str):
+        """Store text under key, then evict expired and least recently used entries"""
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, text, bytes, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, text, size, now, now)
+            )
+            self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            total = self._db.execute("SELECT COALESCE(SUM(bytes), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                rows = self._db.execute("SELECT key, bytes FROM responses ORDER BY last_access").fetchall()
+                evict = []
+                for old_key, old_size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    evict.append((old_key,))
+                    total -= old_size
+                self._db.executemany("DELETE FROM responses WHERE key = ?", evict)
+            self._db.commit()
+            self.bytes_stored += size
+
+    def clear(self):
+        """Remove every cached response"""
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process plus the size of the shared cache file"""
+        with self._lock:
+            entries, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bytes_served": self.bytes_served,
+            "bytes_stored": self.bytes_stored,
+            "entries": entries,
+            "total_bytes": total,
+        }
+
+
+def replay(text: str, chars_per_second: float = REPLAY_CHARS_PER_SECOND, chunk_chars: int = REPLAY_CHUNK_CHARS) -> Iterator[str]:
+    """Yield cached text in chunks at the configured pace, like a live stream"""
+    delay = chunk_chars / chars_per_second if chars_per_second > 0 else 0
+    for start in range(0, len(text), chunk_chars):
+        if delay and start:
+            time.sleep(delay)
+        yield text[start:start + chunk_chars]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Return the process-wide response cache, opening the database on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
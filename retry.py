@@ -0,0 +1,117 @@
+import os
+import time
+import random
+import threading
+import email.utils
+from typing import Callable, Dict, Any, TypeVar
+
+import openai
+
+# Retry budget (overridable through .env); the default deadline covers a 1-3 minute cold start
+RETRY_DEADLINE = float(os.getenv("SMOLLM3_RETRY_DEADLINE") or 240)
+RETRY_BASE_DELAY = float(os.getenv("SMOLLM3_RETRY_BASE_DELAY") or 1.0)
+RETRY_MAX_DELAY = float(os.getenv("SMOLLM3_RETRY_MAX_DELAY") or 30.0)
+
+COLD_START = "cold_start"
+RATE_LIMITED = "rate_limited"
+TIMEOUT = "timeout"
+FATAL = "fatal"
+# Stopped by the caller before a response arrived
+CANCELLED = "cancelled"
+RETRYABLE = (COLD_START, RATE_LIMITED, TIMEOUT)
+
+T = TypeVar("T")
+
+
+class InferenceError(Exception):
+    """A request that failed for good, either fatally or after exhausting its retry deadline"""
+
+    def __init__(self, kind: str, message: str, attempts: int = 1):
+        super().__init__(message)
+        self.kind = kind
+        self.attempts = attempts
+
+
+def classify_error(error: Exception) -> str:
+    """Sort an API exception into cold start, rate limit, timeout or fatal"""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return TIMEOUT
+    if isinstance(error, openai.APIStatusError):
+        if error.status_code == 429:
+            return RATE_LIMITED
+        if error.status_code in (502, 503):
+            # Scale-to-zero endpoints answer 502/503 while a replica is starting
+            return COLD_START
+        if error.status_code in (408, 504):
+            return TIMEOUT
+    return FATAL
+
+
+def retry_after_seconds(error: Exception) -> float | None:
+    """Seconds requested by a Retry-After header, if the error carries one"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            parsed = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            # A malformed header must not turn a retryable error into a crash
+            return None
+        if parsed is None:
+            return None
+        return max(0.0, parsed.timestamp() - time.time())
+
+
+def backoff_delay(attempt: int, base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY) -> float:
+    """Full-jitter exponential backoff for the given 1-based attempt"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+
+def call_with_retry(
+    request: Callable[[], T],
+    on_retry: Callable[[Dict[str, Any]], None] | None = None,
+    deadline: float = RETRY_DEADLINE,
+    base_delay: float = RETRY_BASE_DELAY,
+    max_delay: float = RETRY_MAX_DELAY,
+    sleep: Callable[[float], None] = time.sleep,
+    honor_retry_after: bool = True,
+    cancel: threading.Event | None = None,
+) -> T:
+    """Call request until it succeeds, retrying transient failures within deadline seconds
+
+    Retry-After is honoured when present (unless honor_retry_after is off, e.g.
+    when the next attempt may go to another endpoint); otherwise jittered
+    exponential backoff is used. on_retry receives the error kind, attempt number, upcoming delay and
+    elapsed time before each wait so the caller can show progress. Setting cancel ends a wait
+    straight away with a CANCELLED InferenceError, and no further attempt is sent.
+    """
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        if cancel is not None and cancel.is_set():
+            raise InferenceError(CANCELLED, "Cancelled before a response arrived", attempt)
+        attempt += 1
+        try:
+            return request()
+        except Exception as e:
+            kind = classify_error(e)
+            if kind not in RETRYABLE:
+                raise InferenceError(kind, str(e), attempt) from e
+            delay = retry_after_seconds(e) if honor_retry_after else None
+            if delay is None:
+                delay = backoff_delay(attempt, base_delay, max_delay)
+            elapsed = time.monotonic() - started
+            if elapsed + delay > deadline:
+                raise InferenceError(kind, f"{e} (gave up after {attempt} attempts in {elapsed:.0f}s)", attempt) from e
+            if on_retry:
+                on_retry({"kind": kind, "attempt": attempt, "delay": delay, "elapsed": elapsed, "deadline": deadline})
+            if cancel is not None:
+                cancel.wait(delay)
+            else:
+                sleep(delay)
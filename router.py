@@ -0,0 +1,173 @@
+import os
+import time
+import random
+import threading
+from typing import Dict, Any, List
+
+from retry import RETRYABLE, InferenceError, classify_error
+
+# Circuit breaker settings (overridable through .env)
+BREAKER_FAILURES = int(os.getenv("SMOLLM3_BREAKER_FAILURES") or 3)
+BREAKER_COOLDOWN = float(os.getenv("SMOLLM3_BREAKER_COOLDOWN") or 30)
+# Weight of the newest latency sample in the moving average
+LATENCY_EWMA_ALPHA = 0.3
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def parse_endpoints(spec: str, default_model: str) -> List[Dict[str, str]]:
+    """Parse "name=url[|model],name=url[|model]" into endpoint settings"""
+    endpoints = []
+    for entry in spec.split(","):
+        if not entry.strip():
+            continue
+        name, _, target = entry.partition("=")
+        if not target:
+            name, target = "", name
+        url, _, model = target.strip().partition("|")
+        endpoints.append({"name": name.strip() or url, "base_url": url.strip(), "model": model.strip() or default_model})
+    return endpoints
+
+
+def is_endpoint_failure(error: Exception) -> bool:
+    """Whether an error counts against the endpoint: retryable kinds and any 5xx response"""
+    kind = getattr(error, "kind", None) or classify_error(error)
+    if kind in RETRYABLE:
+        return True
+    # Stream errors arrive wrapped in InferenceError; the status code is on the original
+    cause = error.__cause__ if isinstance(error, InferenceError) and error.__cause__ is not None else error
+    status = getattr(cause, "status_code", None)
+    return status is not None and status >= 500
+
+
+class Endpoint:
+    """Routing state of one OpenAI-compatible endpoint: latency EWMA, in-flight count and circuit breaker"""
+
+    def __init__(self, name: str, base_url: str, model: str):
+        self.name = name
+        self.base_url = base_url
+        self.model = model
+        self.latency = None
+        self.in_flight = 0
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.requests = 0
+        self.failures = 0
+
+
+class Lease:
+    """One request's use of an endpoint; report the first token and the outcome back to the router"""
+
+    def __init__(self, router: "Router", endpoint: Endpoint, probe: bool = False):
+        self.router = router
+        self.endpoint = endpoint
+        # The single request let through a half-open breaker
+        self.probe = probe
+        self.started = time.monotonic()
+        self.latency = None
+        self.finished = False
+
+    def first_token(self):
+        """Record time to first token as the latency sample"""
+        if self.latency is None:
+            self.latency = time.monotonic() - self.started
+
+    def finish(self, error: Exception | None = None):
+        """Release the endpoint; retryable errors and 5xx responses count against its circuit breaker"""
+        if not self.finished:
+            self.finished = True
+            self.router._finish(self, error)
+
+
+class Router:
+    """Spread requests over endpoints, weighted by latency EWMA and in-flight count
+
+    Each endpoint's weight is 1 / (latency * (in_flight + 1)), so fast idle
+    endpoints get most of the traffic without starving the others. After
+    BREAKER_FAILURES consecutive cold starts, rate limits or timeouts an
+    endpoint's breaker opens (any 5xx counts too); after BREAKER_COOLDOWN
+    seconds one probe request is let through (half-open) and its outcome
+    closes or reopens the breaker. A request cancelled before its first token
+    says nothing about the endpoint and leaves the breaker as it is.
+    """
+
+    def __init__(self, endpoints: List[Dict[str, str]], failure_threshold: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN):
+        self.endpoints = [Endpoint(e["name"], e["base_url"], e["model"]) for e in endpoints]
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+
+    def acquire(self) -> Lease:
+        """Pick an endpoint for the next request attempt"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = []
+            for endpoint in self.endpoints:
+                if endpoint.state == OPEN and now - endpoint.opened_at >= self.cooldown:
+                    endpoint.state = HALF_OPEN
+                if endpoint.state == CLOSED or (endpoint.state == HALF_OPEN and not endpoint.probing):
+                    candidates.append(endpoint)
+            if not candidates:
+                # Every breaker is open: try the one that has been resting longest rather than fail outright
+                candidates = [min(self.endpoints, key=lambda e: e.opened_at)]
+
+            known = [e.latency for e in candidates if e.latency is not None]
+            # Unmeasured endpoints are assumed as fast as the best one so they get traffic
+            default_latency = min(known) if known else 1.0
+            weights = [1.0 / (max(e.latency or default_latency, 1e-3) * (e.in_flight + 1)) for e in candidates]
+            endpoint = random.choices(candidates, weights)[0]
+            # A fallback pick of an open or already probing endpoint is not the probe
+            probe = endpoint.state == HALF_OPEN and not endpoint.probing
+            if probe:
+                endpoint.probing = True
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+        return Lease(self, endpoint, probe)
+
+    def _finish(self, lease: Lease, error: Exception | None):
+        """Update the endpoint's latency and breaker with a finished attempt"""
+        endpoint = lease.endpoint
+        failed = error is not None and is_endpoint_failure(error)
+        with self._lock:
+            endpoint.in_flight -= 1
+            if lease.probe:
+                # Only the probe's own outcome ends the half-open trial
+                endpoint.probing = False
+            if failed:
+                endpoint.failures += 1
+                endpoint.consecutive_failures += 1
+                if endpoint.state == HALF_OPEN or endpoint.consecutive_failures >= self.failure_threshold:
+                    endpoint.state = OPEN
+                    endpoint.opened_at = time.monotonic()
+                return
+            if error is None and lease.latency is None:
+                # Cancelled before its first token (e.g. a losing hedge or Stop): neither success nor failure
+                return
+            # Success, or an error that is the request's fault rather than the endpoint's
+            endpoint.consecutive_failures = 0
+            endpoint.state = CLOSED
+            if error is None:
+                if endpoint.latency is None:
+                    endpoint.latency = lease.latency
+                else:
+                    endpoint.latency = (1 - LATENCY_EWMA_ALPHA) * endpoint.latency + LATENCY_EWMA_ALPHA * lease.latency
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Health of every endpoint for display"""
+        with self._lock:
+            return [
+                {
+                    "name": e.name,
+                    "base_url": e.base_url,
+                    "state": e.state,
+                    "latency": e.latency,
+                    "in_flight": e.in_flight,
+                    "requests": e.requests,
+                    "failures": e.failures,
+                }
+                for e in self.endpoints
+            ]
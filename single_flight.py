@@ -0,0 +1,197 @@
+import os
+import threading
+from typing import Callable, Dict, Any, Iterator
+
+from metrics import RequestTimer
+
+# Coalesce identical deterministic streams across sessions (set to 0 to disable)
+COALESCE = os.getenv("SMOLLM3_COALESCE", "1") != "0"
+# How often waiting subscribers wake up to check for retry progress
+STATUS_POLL_SECONDS = 0.5
+
+# start_stream(on_retry, timer, cancel) opens the stream; cancel is set once nobody wants it any more
+StartStream = Callable[[Callable[[Dict[str, Any]], None], RequestTimer, threading.Event], Iterator[str]]
+
+
+class Flight:
+    """One upstream stream whose chunks are buffered and fanned out to every subscriber
+
+    The upstream runs in its own thread so it keeps going if the session that
+    started it reruns or disconnects. Subscribers read from the shared buffer
+    starting at chunk 0, so late joiners replay everything they missed. When
+    every subscriber has closed early the upstream request is closed too.
+    """
+
+    def __init__(self, start_stream: StartStream, on_finished: Callable[["Flight"], None]):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.retry_event = None
+        self.timer = RequestTimer()
+        self.stream = None
+        self.subscribers = 0
+        self.cancelled = False
+        self.cancel_event = threading.Event()
+        self._cond = threading.Condition()
+        self._on_finished = on_finished
+        self._thread = threading.Thread(target=self._run, args=(start_stream,), name="smollm3-flight", daemon=True)
+
+    def start(self):
+        """Start pulling the upstream stream"""
+        self._thread.start()
+
+    def _on_retry(self, event: Dict[str, Any]):
+        """Publish retry progress; subscribers show it from their own threads"""
+        with self._cond:
+            self.retry_event = event
+            self._cond.notify_all()
+
+    def _run(self, start_stream: StartStream):
+        """Upstream thread: append chunks to the shared buffer until the stream ends"""
+        try:
+            stream = start_stream(self._on_retry, self.timer, self.cancel_event)
+            with self._cond:
+                self.stream = stream
+                cancelled = self.cancelled
+            if cancelled:
+                if hasattr(stream, "close"):
+                    stream.close()
+                return
+            for chunk in stream:
+                with self._cond:
+                    self.chunks.append(chunk)
+                    self._cond.notify_all()
+        except Exception as e:
+            with self._cond:
+                self.error = e
+        finally:
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+            self._on_finished(self)
+
+    def subscribe(self, on_retry: Callable[[Dict[str, Any]], None] | None = None, timer: RequestTimer | None = None) -> "Subscription":
+        """Follow the stream from its first chunk"""
+        with self._cond:
+            self.subscribers += 1
+        return Subscription(self, on_retry, timer)
+
+    def _unsubscribe(self):
+        """Drop a subscriber; the last one to leave early cancels the upstream request"""
+        with self._cond:
+            self.subscribers -= 1
+            cancel = self.subscribers == 0 and not self.done
+            if cancel:
+                self.cancelled = True
+                # Drops the request if it is still queued or backing off
+                self.cancel_event.set()
+            stream = self.stream
+            self._cond.notify_all()
+        if cancel and stream is not None and hasattr(stream, "close"):
+            stream.close()
+
+    def _follow(self, subscription: "Subscription", on_retry: Callable[[Dict[str, Any]], None] | None, timer: RequestTimer | None) -> Iterator[str]:
+        """Yield every chunk from the start, then new ones as they arrive; re-raises upstream errors"""
+        index = 0
+        seen_retry = None
+        connected = False
+        while True:
+            with self._cond:
+                while index >= len(self.chunks) and not self.done and self.retry_event is seen_retry and not subscription.closed:
+                    self._cond.wait(STATUS_POLL_SECONDS)
+                if subscription.closed:
+                    return
+                new_chunks = self.chunks[index:]
+                index += len(new_chunks)
+                done, error, retry_event = self.done, self.error, self.retry_event
+
+            if retry_event is not seen_retry:
+                seen_retry = retry_event
+                if on_retry and not new_chunks and not done:
+                    on_retry(retry_event)
+            if timer and not connected and self.timer.connected is not None:
+                timer.mark_connected()
+                connected = True
+            for chunk in new_chunks:
+                if timer:
+                    timer.on_token()
+                yield chunk
+            if done:
+                if error is not None:
+                    raise error
+                if timer:
+                    timer.set_usage(self.timer.usage)
+                return
+
+
+class Subscription:
+    """One subscriber's iterator over a flight; close() may be called from any thread"""
+
+    def __init__(self, flight: Flight, on_retry: Callable[[Dict[str, Any]], None] | None, timer: RequestTimer | None):
+        self.flight = flight
+        self.closed = False
+        self._lock = threading.Lock()
+        self._chunks = flight._follow(self, on_retry, timer)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self._leave()
+            raise
+
+    def close(self):
+        """Stop following the flight"""
+        self._leave()
+
+    def _leave(self):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.flight._unsubscribe()
+
+
+class SingleFlight:
+    """Process-wide registry that attaches identical in-flight requests to one upstream stream"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Flight] = {}
+        self.started = 0
+        self.joined = 0
+
+    def stream(self, key: str, start_stream: StartStream, on_retry: Callable[[Dict[str, Any]], None] | None = None, timer: RequestTimer | None = None) -> Subscription:
+        """Subscribe to the in-flight stream for key, starting it with start_stream if there is none"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None or flight.cancelled:
+                flight = Flight(start_stream, lambda finished: self._finish(key, finished))
+                self._flights[key] = flight
+                self.started += 1
+                flight.start()
+            else:
+                self.joined += 1
+        return flight.subscribe(on_retry, timer)
+
+    def _finish(self, key: str, flight: Flight):
+        """Forget a finished flight so later requests start fresh"""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Upstream streams started versus requests that joined one already running"""
+        with self._lock:
+            return {"in_flight": len(self._flights), "started": self.started, "joined": self.joined}
+
+
+_single_flight = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    """Return the process-wide single-flight registry"""
+    return _single_flight
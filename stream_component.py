@@ -0,0 +1,45 @@
+import os
+from typing import Dict, Any
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+# Browser side of the streaming message: a static page that appends text deltas to its regions
+_stream_message = components.declare_component(
+    "stream_message",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "stream_message"),
+)
+
+
+class DeltaStream:
+    """Send a growing message to the browser as text deltas
+
+    The browser frame keeps the thinking and response text it was sent and
+    appends each update to it, so an update carries only the text past the
+    offsets already sent and a reply costs websocket traffic linear in its
+    length. If the frame misses an update (or is recreated) it reports the
+    lengths it holds, and the next update resends from there.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.sent = {"thinking": 0, "response": 0}
+        self.chars_sent = 0
+        self.updates = 0
+        self._gap = None
+
+    def update(self, thinking: str, response: str, cursor: bool = True):
+        """Draw the message with the given full texts, sending only what the frame does not have yet"""
+        report: Dict[str, Any] | None = st.session_state.get(self.key)
+        if report and report["gap"] != self._gap:
+            self._gap = report["gap"]
+            self.sent = {"thinking": report["thinking"], "response": report["response"]}
+        args = {}
+        for region, text in (("thinking", thinking), ("response", response)):
+            # Earlier text never changes while streaming, so everything before the offset is already there
+            offset = min(self.sent[region], len(text))
+            args[region] = [offset, text[offset:]]
+            self.sent[region] = len(text)
+            self.chars_sent += len(text) - offset
+        self.updates += 1
+        _stream_message(cursor=cursor, key=self.key, default=None, **args)
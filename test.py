@@ -1,5 +1,6 @@
 # SmolLM3 API Test Script
 # pip install openai python-dotenv
+# For concurrency / latency measurements use loadtest.py, which runs the same configs
 
 import os
 from openai import OpenAI
@@ -9,92 +10,95 @@ import json
 # Load environment variables
 load_dotenv()
 
+# Set SMOLLM3_BASE_URL to run against another server, e.g. the local mock_server.py
+BASE_URL = os.getenv("SMOLLM3_BASE_URL") or "https://av7tzsihe44dbvby.us-east-1.aws.endpoints.huggingface.cloud/v1/"
+
+# Test parameters (also used by loadtest.py)
+TEST_CONFIGS = [
+    {
+        "name": "Basic Streaming Test",
+        "params": {
+            "model": "HuggingFaceTB/SmolLM3-3B",
+            "messages": [
+                {
+                    "role": "user",
+                    "content": "What is deep learning?"
+                }
+            ],
+            "stream": True
+        }
+    },
+    {
+        "name": "Full Parameters Test",
+        "params": {
+            "model": "HuggingFaceTB/SmolLM3-3B",
+            "messages": [
+                {
+                    "role": "user",
+                    "content": "Explain machine learning in simple terms."
+                }
+            ],
+            "stream": True,
+            "top_p": 0.9,
+            "temperature": 0.7,
+            "max_tokens": 150,
+            "seed": 42,
+            "stop": ["\n\n", ".", "!"],
+            "frequency_penalty": 0.0,
+            "presence_penalty": 0.0
+        }
+    },
+    {
+        "name": "Creative Writing Test",
+        "params": {
+            "model": "HuggingFaceTB/SmolLM3-3B",
+            "messages": [
+                {
+                    "role": "user",
+                    "content": "Write a short story about AI."
+                }
+            ],
+            "stream": True,
+            "top_p": 0.95,
+            "temperature": 1.0,
+            "max_tokens": 200,
+            "seed": 123,
+            "frequency_penalty": 0.2,
+            "presence_penalty": 0.1
+        }
+    },
+    {
+        "name": "Focused Response Test",
+        "params": {
+            "model": "HuggingFaceTB/SmolLM3-3B",
+            "messages": [
+                {
+                    "role": "user",
+                    "content": "List 5 benefits of renewable energy."
+                }
+            ],
+            "stream": True,
+            "top_p": 0.8,
+            "temperature": 0.3,
+            "max_tokens": 100,
+            "seed": 456,
+            "stop": ["6.", "\n\n"],
+            "frequency_penalty": 0.1,
+            "presence_penalty": 0.0
+        }
+    }
+]
+
 def test_smollm3_api():
     """Test SmolLM3 API with various parameters"""
     
     # Initialize client
     client = OpenAI(
-        base_url="https://av7tzsihe44dbvby.us-east-1.aws.endpoints.huggingface.cloud/v1/",
+        base_url=BASE_URL,
         api_key=os.getenv("HF_TOKEN", "$HF_TOKEN")  # Use environment variable or placeholder
     )
     
-    # Test parameters
-    test_configs = [
-        {
-            "name": "Basic Streaming Test",
-            "params": {
-                "model": "HuggingFaceTB/SmolLM3-3B",
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": "What is deep learning?"
-                    }
-                ],
-                "stream": True
-            }
-        },
-        {
-            "name": "Full Parameters Test",
-            "params": {
-                "model": "HuggingFaceTB/SmolLM3-3B",
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": "Explain machine learning in simple terms."
-                    }
-                ],
-                "stream": True,
-                "top_p": 0.9,
-                "temperature": 0.7,
-                "max_tokens": 150,
-                "seed": 42,
-                "stop": ["\n\n", ".", "!"],
-                "frequency_penalty": 0.0,
-                "presence_penalty": 0.0
-            }
-        },
-        {
-            "name": "Creative Writing Test",
-            "params": {
-                "model": "HuggingFaceTB/SmolLM3-3B",
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": "Write a short story about AI."
-                    }
-                ],
-                "stream": True,
-                "top_p": 0.95,
-                "temperature": 1.0,
-                "max_tokens": 200,
-                "seed": 123,
-                "frequency_penalty": 0.2,
-                "presence_penalty": 0.1
-            }
-        },
-        {
-            "name": "Focused Response Test",
-            "params": {
-                "model": "HuggingFaceTB/SmolLM3-3B",
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": "List 5 benefits of renewable energy."
-                    }
-                ],
-                "stream": True,
-                "top_p": 0.8,
-                "temperature": 0.3,
-                "max_tokens": 100,
-                "seed": 456,
-                "stop": ["6.", "\n\n"],
-                "frequency_penalty": 0.1,
-                "presence_penalty": 0.0
-            }
-        }
-    ]
-    
-    for config in test_configs:
+    for config in TEST_CONFIGS:
         print(f"\n{'='*60}")
         print(f"Running: {config['name']}")
         print(f"{'='*60}")
@@ -124,7 +128,6 @@ def test_smollm3_api():
             print(f"Error type: {type(e).__name__}")
         
         print(f"\n{'='*60}")
-        input("Press Enter to continue to next test...")
 
 def test_non_streaming():
     """Test non-streaming mode for comparison"""
@@ -133,7 +136,7 @@ def test_non_streaming():
     print(f"{'='*60}")
     
     client = OpenAI(
-        base_url="https://av7tzsihe44dbvby.us-east-1.aws.endpoints.huggingface.cloud/v1/",
+        base_url=BASE_URL,
         api_key=os.getenv("HF_TOKEN", "$HF_TOKEN")
     )
     
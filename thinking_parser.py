@@ -0,0 +1,117 @@
+import re
+from typing import List, Tuple
+
+# Opening tag (lowercase) -> matching closing tag
+THINKING_TAGS = {
+    "<thinking>": "</thinking>",
+    "<think>": "</think>",
+    "*thinking*": "*/thinking*",
+    "[thinking]": "[/thinking]",
+}
+
+_OPEN_PATTERN = re.compile(
+    "|".join(re.escape(tag) for tag in sorted(THINKING_TAGS, key=len, reverse=True)),
+    re.IGNORECASE
+)
+_CLOSE_PATTERNS = {
+    tag: re.compile(re.escape(close), re.IGNORECASE) for tag, close in THINKING_TAGS.items()
+}
+
+
+def _partial_tag_length(text: str, tags) -> int:
+    """Length of the longest suffix of text that could be the start of one of tags"""
+    longest = max(len(tag) for tag in tags) - 1
+    tail = text[-longest:].lower() if longest else ""
+    for size in range(len(tail), 0, -1):
+        suffix = tail[-size:]
+        if any(tag.startswith(suffix) for tag in tags):
+            return size
+    return 0
+
+
+class ThinkingStreamParser:
+    """Incrementally split streamed text into thinking and response parts
+
+    Each chunk is scanned once; only a possible partial tag (a few characters)
+    is carried over to the next chunk, so feeding is amortized O(1) per chunk.
+    """
+
+    def __init__(self):
+        self._thinking: List[str] = []
+        self._response: List[str] = []
+        self._pending = ""
+        self._open_tag = None  # lowercase opener of the block we are inside, if any
+        self.response_started = False
+
+    @property
+    def in_thinking(self) -> bool:
+        """True while inside an unclosed thinking block"""
+        return self._open_tag is not None
+
+    def feed(self, chunk: str):
+        """Consume the next chunk of streamed text"""
+        text = self._pending + chunk
+        self._pending = ""
+        pos = 0
+        while True:
+            if self._open_tag is None:
+                match = _OPEN_PATTERN.search(text, pos)
+            else:
+                match = _CLOSE_PATTERNS[self._open_tag].search(text, pos)
+            if match is None:
+                break
+            self._emit(text[pos:match.start()])
+            if self._open_tag is None:
+                self._open_tag = match.group(0).lower()
+            else:
+                self._open_tag = None
+                # Keep separate thinking blocks apart
+                if self._thinking and not self._thinking[-1].endswith("\n"):
+                    self._thinking.append("\n")
+            pos = match.end()
+
+        rest = text[pos:]
+        tags = THINKING_TAGS if self._open_tag is None else (THINKING_TAGS[self._open_tag],)
+        hold = _partial_tag_length(rest, tags)
+        if hold:
+            self._pending = rest[-hold:]
+            rest = rest[:-hold]
+        self._emit(rest)
+
+    def close(self):
+        """Flush any held-back partial tag at end of stream"""
+        if self._pending:
+            self._emit(self._pending)
+            self._pending = ""
+
+    def _emit(self, text: str):
+        """Append text to whichever buffer is active"""
+        if not text:
+            return
+        if self._open_tag is not None:
+            self._thinking.append(text)
+        else:
+            self._response.append(text)
+            if not self.response_started and text.strip():
+                self.response_started = True
+
+    @staticmethod
+    def _joined(parts: List[str]) -> str:
+        """Join buffered parts, collapsing them so repeated reads stay cheap"""
+        if len(parts) > 1:
+            parts[:] = ["".join(parts)]
+        return parts[0] if parts else ""
+
+    @property
+    def thinking(self) -> str:
+        """Thinking text seen so far"""
+        return self._joined(self._thinking).strip()
+
+    @property
+    def response(self) -> str:
+        """Response text seen so far, without thinking blocks"""
+        return self._joined(self._response).strip()
+
+    def result(self) -> Tuple[str, str]:
+        """Return (thinking, response) for the text seen so far"""
+        return self.thinking, self.response
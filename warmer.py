@@ -0,0 +1,182 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, Any, List
+
+from client_pool import get_client_pool
+from retry import classify_error, COLD_START
+
+logger = logging.getLogger("smollm3.warmer")
+
+# Keep-warm settings (overridable through .env); the scheduler is off unless SMOLLM3_KEEP_WARM is set
+KEEP_WARM = os.getenv("SMOLLM3_KEEP_WARM", "").lower() in ("1", "true", "yes")
+WARM_SCHEDULE = os.getenv("SMOLLM3_WARM_SCHEDULE") or "business_hours"
+WARM_INTERVAL = float(os.getenv("SMOLLM3_WARM_INTERVAL") or 600)
+WARM_HOURS = os.getenv("SMOLLM3_WARM_HOURS") or "8-18"
+WARM_DAYS = os.getenv("SMOLLM3_WARM_DAYS") or "0-4"
+WARM_MIN_REQUESTS = int(os.getenv("SMOLLM3_WARM_MIN_REQUESTS") or 3)
+COLD_LATENCY_THRESHOLD = float(os.getenv("SMOLLM3_WARM_COLD_THRESHOLD") or 5.0)
+PROBE_HISTORY = 200
+
+
+def _parse_range(spec: str) -> range:
+    """Turn '8-18' into range(8, 19)"""
+    start, _, end = spec.partition("-")
+    return range(int(start), int(end or start) + 1)
+
+
+class BusinessHoursSchedule:
+    """Keep warm on the configured weekdays between the configured hours (local time)"""
+
+    def __init__(self, hours: str = WARM_HOURS, days: str = WARM_DAYS):
+        self.hours = _parse_range(hours)
+        self.days = _parse_range(days)
+
+    def record_request(self, when: datetime):
+        """Business hours ignore observed traffic"""
+
+    def is_active(self, when: datetime) -> bool:
+        """True when the endpoint should be kept warm at this time"""
+        return when.weekday() in self.days and when.hour in self.hours
+
+
+class TrafficSchedule:
+    """Keep warm during hours of the week that have seen real traffic
+
+    Requests are counted per hour-of-week bucket. An hour is active when it, or
+    the hour after it (so the replica is up before users arrive), has seen at
+    least min_requests requests.
+    """
+
+    def __init__(self, min_requests: int = WARM_MIN_REQUESTS):
+        self.min_requests = min_requests
+        self.counts = [0] * (7 * 24)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bucket(when: datetime) -> int:
+        """Hour-of-week index, Monday 00:00 being 0"""
+        return when.weekday() * 24 + when.hour
+
+    def record_request(self, when: datetime):
+        """Count a user request in its hour-of-week bucket"""
+        with self._lock:
+            self.counts[self._bucket(when)] += 1
+
+    def is_active(self, when: datetime) -> bool:
+        """True when this hour or the next one is busy enough to keep warm"""
+        bucket = self._bucket(when)
+        with self._lock:
+            return max(self.counts[bucket], self.counts[(bucket + 1) % len(self.counts)]) >= self.min_requests
+
+
+class Warmer:
+    """Background thread that sends 1-token probes to keep every routed endpoint from scaling to zero"""
+
+    def __init__(
+        self,
+        endpoints: List[Dict[str, str]],
+        api_key: str,
+        schedule,
+        interval: float = WARM_INTERVAL,
+        cold_threshold: float = COLD_LATENCY_THRESHOLD,
+        now: Callable[[], datetime] = datetime.now,
+    ):
+        # The router's endpoint settings: name, base_url and model
+        self.endpoints = endpoints
+        self.api_key = api_key
+        self.schedule = schedule
+        self.interval = interval
+        self.cold_threshold = cold_threshold
+        self.now = now
+        self.last_request = 0.0
+        self.probes: deque = deque(maxlen=PROBE_HISTORY)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="smollm3-warmer", daemon=True)
+
+    def start(self):
+        """Start the probe thread"""
+        self._thread.start()
+
+    def stop(self):
+        """Ask the probe thread to exit"""
+        self._stop.set()
+
+    @property
+    def running(self) -> bool:
+        """True while the probe thread is alive"""
+        return self._thread.is_alive()
+
+    def record_request(self):
+        """Note real user traffic; probes are skipped while traffic keeps the endpoint warm"""
+        self.last_request = time.monotonic()
+        self.schedule.record_request(self.now())
+
+    def _run(self):
+        """Probe loop: wake every interval and probe if the schedule says so"""
+        while not self._stop.wait(self.interval):
+            if not self.schedule.is_active(self.now()):
+                continue
+            if time.monotonic() - self.last_request < self.interval:
+                continue
+            self.probe_all()
+
+    def probe_all(self) -> List[Dict[str, Any]]:
+        """Probe every endpoint in turn"""
+        return [self.probe(endpoint) for endpoint in self.endpoints]
+
+    def probe(self, endpoint: Dict[str, str]) -> Dict[str, Any]:
+        """Send one 1-token completion to an endpoint and record its latency and cold/warm state"""
+        client_lease = get_client_pool().acquire(endpoint["base_url"], self.api_key)
+        started = time.perf_counter()
+        result = {"time": self.now().isoformat(timespec="seconds"), "endpoint": endpoint["name"], "state": "warm", "error": None}
+        try:
+            client_lease.client.chat.completions.create(
+                model=endpoint["model"],
+                messages=[{"role": "user", "content": "ping"}],
+                max_tokens=1,
+                stream=False
+            )
+        except Exception as e:
+            result["error"] = str(e)
+            result["state"] = "cold" if classify_error(e) == COLD_START else "error"
+        finally:
+            client_lease.release()
+        result["latency"] = time.perf_counter() - started
+        if result["state"] == "warm" and result["latency"] > self.cold_threshold:
+            result["state"] = "cold"
+        self.probes.append(result)
+        logger.info("keep-warm probe of %s: %s in %.2fs%s", result["endpoint"], result["state"], result["latency"],
+                    f" ({result['error']})" if result["error"] else "")
+        return result
+
+    def history(self) -> List[Dict[str, Any]]:
+        """Most recent probe results, oldest first"""
+        return list(self.probes)
+
+
+_warmer = None
+_warmer_lock = threading.Lock()
+
+
+def start_warmer(endpoints: List[Dict[str, str]], api_key: str) -> Warmer | None:
+    """Start the process-wide warmer once, if SMOLLM3_KEEP_WARM is enabled"""
+    global _warmer
+    with _warmer_lock:
+        if _warmer is None and KEEP_WARM and api_key:
+            schedule = TrafficSchedule() if WARM_SCHEDULE == "traffic" else BusinessHoursSchedule()
+            if not logger.handlers:
+                logger.addHandler(logging.StreamHandler())
+                logger.setLevel(logging.INFO)
+            _warmer = Warmer(endpoints, api_key, schedule)
+            _warmer.start()
+            logger.info("keep-warm scheduler started (%s, every %.0fs)", WARM_SCHEDULE, WARM_INTERVAL)
+        return _warmer
+
+
+def get_warmer() -> Warmer | None:
+    """Return the running warmer, if any"""
+    return _warmer